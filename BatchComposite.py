@@ -0,0 +1,267 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Headless batch compositing on a process pool, backgrounds and masks shared between the workers
+
+python BatchComposite.py --background Assets/background1.png --output "out/{name}.png" sprites/*.png
+python BatchComposite.py --jobs jobs.jsonl --workers 8 --report report.json
+
+jobs.jsonl, one job per line:
+{"foreground": "Assets/Asteroid.png", "background": "Assets/Lava.png", "output": "out/asteroid.png",
+ "mode": "blend_texture_add", "mask": "Assets/radial1_inverted.png", "position": [0, 0]}
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy
+
+from Compositing import alpha_blend, blend_add, planes, to_surface, rgba32
+from MaskPyramid import MaskRegistry, load_alpha
+
+MODES = ('alpha_blending', 'blend_texture_add')
+
+# Worker state, shared arrays attached once per process (see _init_worker)
+_SHARED = {}
+_MASKS = None
+
+
+def load_rgba(path_: str) -> numpy.ndarray:
+    """
+    Decode an image (pygame imported on first use).
+
+    :param path_: Image path
+    :return: Return a contiguous uint8 array (h, w, 4) RGBA
+    """
+    import pygame
+    rgb, alpha = planes(rgba32(pygame.image.load(path_)))
+    return numpy.concatenate((rgb, alpha[:, :, numpy.newaxis]), axis=2)
+
+
+def share(array_: numpy.ndarray) -> tuple:
+    """
+    Copy an array into a new shared memory block.
+
+    :param array_: numpy array
+    :return: Return a tuple (SharedMemory, descriptor (name, shape, dtype) to attach it, see attach)
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(array_.nbytes, 1))
+    numpy.ndarray(array_.shape, dtype=array_.dtype, buffer=block.buf)[...] = array_
+    return block, (block.name, array_.shape, array_.dtype.str)
+
+
+def attach(descriptor_: tuple) -> tuple:
+    """
+    Attach a shared memory block created by share (no copy).
+
+    :param descriptor_: tuple (name, shape, dtype)
+    :return: Return a tuple (SharedMemory, read only numpy array referencing the block)
+    """
+    name, shape, dtype = descriptor_
+    block = shared_memory.SharedMemory(name=name)
+    array = numpy.ndarray(shape, dtype=dtype, buffer=block.buf)
+    array.flags.writeable = False
+    return block, array
+
+
+def _init_worker(descriptors_: dict) -> None:
+    """
+    Process pool initializer, attach the backgrounds and masks.
+
+    :param descriptors_: dict key -> descriptor (see share), keys ('background', path) or ('mask', path)
+    """
+    global _MASKS
+    _MASKS = MaskRegistry()
+    for key, descriptor in descriptors_.items():
+        _SHARED[key] = attach(descriptor)
+        if key[0] == 'mask':
+            # Pyramids built from the shared alpha, once per worker
+            _MASKS.register(key[1], _SHARED[key][1])
+
+
+def _run_job(job_: tuple) -> dict:
+    """
+    Composite one job in a worker and save the result.
+
+    :param job_: tuple (index, job dict, see composite_batch)
+    :return: Return a dict with the job index, output path, pixels, seconds and error (None or message)
+    """
+    index, job = job_
+    start = time.perf_counter()
+    try:
+        background = _SHARED[('background', job['background'])][1]
+        foreground = load_rgba(job['foreground'])
+        out = numpy.array(background)
+
+        # Sprite placed at position, clipped to the background
+        x, y = job.get('position', (0, 0))
+        h, w = foreground.shape[:2]
+        top, left = max(y, 0), max(x, 0)
+        bottom, right = min(y + h, out.shape[0]), min(x + w, out.shape[1])
+        # Pixels blended (clipped region)
+        pixels = max(bottom - top, 0) * max(right - left, 0)
+        if bottom > top and right > left:
+            region = slice(top, bottom), slice(left, right)
+            sprite = slice(top - y, bottom - y), slice(left - x, right - x)
+            if job.get('mode', 'alpha_blending') == 'alpha_blending':
+                alpha_blend(foreground[sprite], out[region], job.get('integer', False), out_=out[region])
+            else:
+                set_alpha1 = float(job.get('alpha', 1.0))
+                if job.get('mask'):
+                    set_alpha1 = _MASKS.get(job['mask'], (w, h))[sprite]
+                blend_add(foreground[sprite], out[region], set_alpha1, float(job.get('background_alpha', 1.0)),
+                          job.get('mask_', False), job.get('integer', False), out_=out[region])
+
+        import pygame
+        directory = os.path.dirname(job['output'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        pygame.image.save(to_surface(out), job['output'])
+        error = None
+    except Exception as exception:
+        error = '%s: %s' % (type(exception).__name__, exception)
+        pixels = 0
+    return {'index': index, 'foreground': job.get('foreground'), 'output': job.get('output'),
+            'pixels': pixels, 'seconds': time.perf_counter() - start, 'error': error}
+
+
+def composite_batch(jobs_: list, workers_: int = None, progress_=None) -> dict:
+    """
+    Composite a list of jobs on a process pool.
+
+    Every distinct background and mask is decoded once in the calling process into shared memory,
+    the workers reference them without copy (no pixels are pickled). Each worker saves its results,
+    the statistics are streamed back as the jobs complete.
+
+    :param jobs_: list of dict with the keys
+    foreground (image path), background (image path), output (image path),
+    mode ('alpha_blending' default or 'blend_texture_add'), position ((x, y) of the foreground, default (0, 0)),
+    integer (bool), and for blend_texture_add: mask (image path, alpha of the foreground, resized to it),
+    alpha (float foreground alpha without mask), background_alpha (float), mask_ (bool, black pixels mask)
+    :param workers_: Number of processes (default os.cpu_count())
+    :param progress_: Optional callable(dict) called with the statistics of each job as it completes
+    :return: Return a dict with the per-job statistics (list) and the aggregate throughput
+    """
+    assert isinstance(jobs_, (list, tuple)), \
+        'Expecting list for argument jobs_ got %s ' % type(jobs_)
+    for job in jobs_:
+        assert job.get('mode', 'alpha_blending') in MODES, \
+            'Expecting alpha_blending or blend_texture_add for a job mode got %s ' % job.get('mode')
+
+    start = time.perf_counter()
+    blocks = []
+    descriptors = {}
+    try:
+        for job in jobs_:
+            key = ('background', job['background'])
+            if key not in descriptors:
+                block, descriptors[key] = share(load_rgba(job['background']))
+                blocks.append(block)
+            if job.get('mask') and ('mask', job['mask']) not in descriptors:
+                block, descriptors[('mask', job['mask'])] = share(load_alpha(job['mask']))
+                blocks.append(block)
+
+        results = []
+        with multiprocessing.Pool(workers_ or os.cpu_count() or 1, _init_worker, (descriptors,)) as pool:
+            for result in pool.imap_unordered(_run_job, enumerate(jobs_)):
+                result['mpix_per_s'] = result['pixels'] / result['seconds'] / 1e6 if result['seconds'] > 0 else 0.0
+                results.append(result)
+                if progress_ is not None:
+                    progress_(result)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    seconds = time.perf_counter() - start
+    pixels = sum(result['pixels'] for result in results)
+    results.sort(key=lambda result: result['index'])
+    return {'jobs': results, 'count': len(results),
+            'errors': sum(result['error'] is not None for result in results),
+            'seconds': seconds, 'jobs_per_s': len(results) / seconds if seconds > 0 else 0.0,
+            'mpix_per_s': pixels / seconds / 1e6 if seconds > 0 else 0.0}
+
+
+def main(argv_: list = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv_: Arguments (default sys.argv[1:])
+    :return: Return the exit code, 1 when a job failed
+    """
+    parser = argparse.ArgumentParser(description='Composite foreground images over backgrounds (headless).')
+    parser.add_argument('foregrounds', nargs='*', help='foreground images (with --background and --output)')
+    parser.add_argument('--jobs', help='JSON lines file, one job (dict) per line, see composite_batch')
+    parser.add_argument('--background', help='background image for the positional foregrounds')
+    parser.add_argument('--output', default='{name}_blend.png',
+                        help='output path format, fields {index} and {name} (foreground name without extension)')
+    parser.add_argument('--mode', default='alpha_blending', choices=MODES)
+    parser.add_argument('--mask', help='blend_texture_add, mask image used as foreground alpha')
+    parser.add_argument('--integer', action='store_true', help='uint16 fixed point path instead of float64')
+    parser.add_argument('--workers', type=int, help='number of processes (default cpu count)')
+    parser.add_argument('--report', help='write the statistics (JSON) to this file')
+    args = parser.parse_args(argv_)
+
+    jobs = []
+    if args.jobs:
+        with open(args.jobs) as file:
+            jobs.extend(json.loads(line) for line in file if line.strip())
+    if args.foregrounds:
+        if not args.background:
+            parser.error('--background is required with positional foregrounds')
+        for index, path in enumerate(args.foregrounds):
+            jobs.append({'foreground': path, 'background': args.background, 'mode': args.mode,
+                         'mask': args.mask, 'integer': args.integer,
+                         'output': args.output.format(index=index, name=os.path.splitext(os.path.basename(path))[0])})
+    if not jobs:
+        parser.error('no job, give foreground images or --jobs')
+
+    def progress(result_):
+        if result_['error'] is None:
+            print('%s -> %s %.3f s (%.1f Mpix/s)' % (result_['foreground'], result_['output'],
+                                                     result_['seconds'], result_['mpix_per_s']), file=sys.stderr)
+        else:
+            print('%s FAILED %s' % (result_['foreground'], result_['error']), file=sys.stderr)
+
+    stats = composite_batch(jobs, args.workers, progress)
+    print('%(count)s jobs (%(errors)s failed) in %(seconds).3f s, %(jobs_per_s).1f jobs/s, %(mpix_per_s).1f Mpix/s'
+          % stats)
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(stats, file, indent=1)
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
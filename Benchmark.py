@@ -0,0 +1,268 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Headless benchmark of the blend kernels
+
+python Benchmark.py --sizes 256,1080p --save baseline.json
+python Benchmark.py --sizes 256,1080p --compare baseline.json
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import importlib
+import statistics
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+import numpy
+
+from BlendTexture import blend_texture_add
+from Compositing import alpha_blend, planes, jit, alpha_blending_loop
+
+# alpha-blending.py is not a valid module name for the import statement
+alpha_blending_module = importlib.import_module('alpha-blending')
+
+SIZES = {'256': (256, 256), '512': (512, 512), '1024': (1024, 1024),
+         '1080p': (1920, 1080), '4k': (3840, 2160)}
+
+# Benchmarked functions, alpha_blending_1 is a per-pixel python loop without numba
+FUNCTIONS = ('alpha_blending', 'alpha_blending_int', 'alpha_blending_fused', 'alpha_blending_lut', 'alpha_blending_1',
+             'alpha_blend', 'blend_texture_add', 'blend_texture_add_int')
+
+# Largest frame (pixels) benchmarked for alpha_blending_1 when numba is not installed
+LOOP_MAX_PIXELS = 256 * 256
+
+
+def random_surface(w_: int, h_: int, opaque_: bool, seed_: int) -> pygame.Surface:
+    """
+    :param w_: width
+    :param h_: height
+    :param opaque_: True | False, alpha channel 255 everywhere or random values
+    :param seed_: Random generator seed (same pixels for every run)
+    :return: Return a 32-bit Surface with per-pixel alpha filled with random values
+    """
+    rng = numpy.random.default_rng(seed_)
+    surface = pygame.Surface((w_, h_), pygame.SRCALPHA, 32)
+    pygame.surfarray.pixels3d(surface)[...] = rng.integers(0, 256, (w_, h_, 3), dtype=numpy.uint8)
+    pygame.surfarray.pixels_alpha(surface)[...] = 255 if opaque_ else rng.integers(0, 256, (w_, h_), dtype=numpy.uint8)
+    return surface
+
+
+def cases(functions_: list, sizes_: list) -> list:
+    """
+    :param functions_: Names of the functions to benchmark (see FUNCTIONS)
+    :param sizes_: Names of the sizes (see SIZES)
+    :return: Return the list of benchmark cases (dict)
+    """
+    result = []
+    for function, size, background in itertools.product(functions_, sizes_, ('opaque', 'translucent')):
+        w, h = SIZES[size]
+        if function == 'alpha_blending_1' and jit(alpha_blending_loop) is None and w * h > LOOP_MAX_PIXELS:
+            continue
+        if function.startswith('blend_texture_add'):
+            for alpha, mask in itertools.product(('scalar', 'array'), (False, True)):
+                result.append({'function': function, 'size': (w, h), 'background': background,
+                               'alpha': alpha, 'mask': mask})
+        else:
+            result.append({'function': function, 'size': (w, h), 'background': background,
+                           'alpha': None, 'mask': None})
+    for case in result:
+        case['name'] = '%s/%sx%s/bg=%s/alpha=%s/mask=%s' % (
+            case['function'], case['size'][0], case['size'][1], case['background'], case['alpha'], case['mask'])
+    return result
+
+
+def call(case_: dict):
+    """
+    Build the inputs of a case.
+
+    :param case_: Benchmark case (see cases)
+    :return: Return a callable without argument running the case once
+    """
+    w, h = case_['size']
+    surface1 = random_surface(w, h, False, 1)
+    surface2 = random_surface(w, h, case_['background'] == 'opaque', 2)
+    function = case_['function']
+
+    if function == 'alpha_blending':
+        return lambda: alpha_blending_module.alpha_blending(surface1, surface2, kernel_='numpy')
+    if function == 'alpha_blending_int':
+        return lambda: alpha_blending_module.alpha_blending(surface1, surface2, integer_=True)
+    if function == 'alpha_blending_fused':
+        return lambda: alpha_blending_module.alpha_blending(surface1, surface2, kernel_='fused')
+    if function == 'alpha_blending_lut':
+        return lambda: alpha_blending_module.alpha_blending(surface1, surface2, kernel_='lut')
+    if function == 'alpha_blending_1':
+        return lambda: alpha_blending_module.alpha_blending_1(surface1, surface2)
+    if function == 'alpha_blend':
+        # Array core, contiguous uint8 RGBA arrays in and out (no Surface)
+        array1, array2 = [numpy.concatenate((rgb, alpha[:, :, numpy.newaxis]), axis=2)
+                          for rgb, alpha in (planes(surface1), planes(surface2))]
+        return lambda: alpha_blend(array1, array2)
+
+    alpha1 = 0.5 if case_['alpha'] == 'scalar' \
+        else numpy.random.default_rng(3).random((h, w, 1))
+    integer = function == 'blend_texture_add_int'
+    return lambda: blend_texture_add(surface1, surface2, alpha1, 1.0, case_['mask'], integer)
+
+
+def run_case(case_: dict, repeat_: int) -> dict:
+    """
+    Time a case (median of repeat_ calls after a warm up call) and measure its memory.
+
+    :param case_: Benchmark case (see cases)
+    :param repeat_: Number of timed calls
+    :return: Return the case completed with the measures
+    """
+    function = call(case_)
+    w, h = case_['size']
+
+    # Warm up (numba compilation, caches)
+    function()
+    timings = []
+    for _ in range(repeat_):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    seconds = statistics.median(timings)
+
+    # Memory, numpy reports its buffers to tracemalloc
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    result = function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    net_blocks = sys.getallocatedblocks() - blocks
+
+    record = {key: value for key, value in case_.items()}
+    record.update({
+        'seconds': seconds,
+        'mpix_per_s': w * h / seconds / 1e6,
+        'peak_bytes': peak - before,
+        # Peak memory expressed in uint8 RGBA frames (w x h x 4 bytes)
+        'peak_frames': (peak - before) / (w * h * 4),
+        'retained_bytes': current - before,
+        'net_blocks': net_blocks})
+    return record
+
+
+def compare(results_: list, baseline_: list, tolerance_: float) -> list:
+    """
+    Compare the results with a baseline (same case names).
+
+    :param results_: Current results (see run_case)
+    :param baseline_: Saved results
+    :param tolerance_: Relative tolerance (e.g. 0.1, 10% slower or bigger is a regression)
+    :return: Return a list of dict describing the regressions
+    """
+    baseline = {record['name']: record for record in baseline_}
+    regressions = []
+    for record in results_:
+        reference = baseline.get(record['name'])
+        if reference is None:
+            continue
+        if record['mpix_per_s'] < reference['mpix_per_s'] * (1 - tolerance_):
+            regressions.append({'name': record['name'], 'metric': 'mpix_per_s',
+                                'baseline': reference['mpix_per_s'], 'value': record['mpix_per_s']})
+        if record['peak_bytes'] > reference['peak_bytes'] * (1 + tolerance_):
+            regressions.append({'name': record['name'], 'metric': 'peak_bytes',
+                                'baseline': reference['peak_bytes'], 'value': record['peak_bytes']})
+    return regressions
+
+
+def main(argv_: list = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv_: Arguments (default sys.argv[1:])
+    :return: Return the exit code, 1 when a regression is found
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the alpha compositing kernels (headless).')
+    parser.add_argument('--sizes', default='256,512,1080p,4k',
+                        help='comma separated sizes among %s' % ', '.join(SIZES))
+    parser.add_argument('--functions', default=','.join(FUNCTIONS),
+                        help='comma separated functions among %s' % ', '.join(FUNCTIONS))
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per case (median)')
+    parser.add_argument('--output', help='write the results (JSON) to this file instead of stdout')
+    parser.add_argument('--save', help='save the results as a baseline (JSON)')
+    parser.add_argument('--compare', help='baseline (JSON) to compare the results with')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='relative tolerance for --compare')
+    args = parser.parse_args(argv_)
+
+    pygame.init()
+    sizes = args.sizes.split(',')
+    functions = args.functions.split(',')
+    for name in sizes:
+        assert name in SIZES, 'Unknown size %s ' % name
+    for name in functions:
+        assert name in FUNCTIONS, 'Unknown function %s ' % name
+
+    results = []
+    for case in cases(functions, sizes):
+        record = run_case(case, args.repeat)
+        results.append(record)
+        print('%-70s %9.2f Mpix/s %8.1f MB peak' % (
+            record['name'], record['mpix_per_s'], record['peak_bytes'] / 1e6), file=sys.stderr)
+
+    report = {'machine': {'python': platform.python_version(), 'numpy': numpy.__version__,
+                          'pygame': pygame.version.ver, 'platform': platform.platform(),
+                          'processor': platform.processor(), 'cpus': os.cpu_count(),
+                          'numba': jit(alpha_blending_loop) is not None},
+              'results': results}
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(report, file, indent=1)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file)['results'], args.tolerance)
+        report['regressions'] = regressions
+        for regression in regressions:
+            print('REGRESSION %(name)s %(metric)s %(baseline).6g -> %(value).6g' % regression, file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
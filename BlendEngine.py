@@ -0,0 +1,182 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Tiled multi-threaded blend engine (alpha_blending & blend_texture_add kernels)
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+import numpy
+
+from Compositing import alpha_to_int, alpha_to_float, alpha_blending_float, alpha_blending_int, \
+    blend_texture_add_float, blend_texture_add_int, output_views, planes, to_surface
+
+
+class BlendEngine:
+    """
+    Run the blend kernels tile by tile on a thread pool (numpy releases the GIL).
+
+    Each tile reads the surfaces through views (no full size copy) and its float temporaries
+    stay small enough to remain in cache. The kernels are element wise, the output is
+    bit-identical to the serial alpha_blending (numpy or integer kernel, see set_kernel) and
+    blend_texture_add.
+    """
+
+    def __init__(self, workers_: int = None, tile_: tuple = (256, 64)):
+        """
+        :param workers_: Number of threads (default os.cpu_count())
+        :param tile_: Tile size (width, height) in pixels
+        """
+        assert workers_ is None or (isinstance(workers_, int) and workers_ > 0), \
+            'Expecting positive int for argument workers_ got %s ' % workers_
+        assert len(tile_) == 2 and tile_[0] > 0 and tile_[1] > 0, \
+            'Expecting tuple (width, height) for argument tile_ got %s ' % (tile_,)
+        self.workers = workers_ or os.cpu_count() or 1
+        self.tile = tuple(tile_)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shut down the thread pool.
+
+        :return: None
+        """
+        self.executor.shutdown(wait=True)
+
+    def tiles(self, w_: int, h_: int) -> list:
+        """
+        :param w_: width
+        :param h_: height
+        :return: Return a list of tile slices (rows, columns) covering the frame
+        """
+        tile_w, tile_h = self.tile
+        return [(slice(y, min(y + tile_h, h_)), slice(x, min(x + tile_w, w_)))
+                for y in range(0, h_, tile_h) for x in range(0, w_, tile_w)]
+
+    def run(self, function_, w_: int, h_: int) -> None:
+        """
+        Call function_(tile) for every tile of the frame on the thread pool.
+
+        :param function_: Callable taking a tuple of slices (rows, columns)
+        :param w_: width
+        :param h_: height
+        :return: None
+        """
+        # list() re-raises the exceptions raised in the workers
+        list(self.executor.map(function_, self.tiles(w_, h_)))
+
+    def alpha_blending(self, surface1_: pygame.Surface, surface2_: pygame.Surface,
+                       integer_: bool = False,
+                       out_: (pygame.Surface, numpy.ndarray) = None) -> (pygame.Surface, numpy.ndarray):
+        """
+        Tiled version of alpha_blending (same arguments and result).
+
+        :param surface1_: First layer texture (foreground)
+        :param surface2_: Second layer texture (background)
+        :param integer_: True | False, use the uint16 fixed point path instead of float64
+        :param out_: Optional destination, 32-bit Surface with per-pixel alpha or uint8 array (h, w, 4)
+        :return: Return a pygame surface (blend between surface1 & surface2) or out_
+        """
+        assert isinstance(surface1_, pygame.Surface), \
+            'Expecting Surface for argument surface got %s ' % type(surface1_)
+        assert isinstance(surface2_, pygame.Surface), \
+            'Expecting Surface for argument surface2_ got %s ' % type(surface2_)
+
+        w, h = surface1_.get_size()
+        rgb1, alpha1 = planes(surface1_)
+        rgb2, alpha2 = planes(surface2_)
+        out = numpy.empty((h, w, 4), dtype=numpy.uint8) if out_ is None else out_
+        rgb_out, alpha_out = output_views(out, w, h)
+        kernel = alpha_blending_int if integer_ else alpha_blending_float
+
+        def blend_tile(tile_):
+            kernel(rgb1[tile_], alpha1[tile_], rgb2[tile_], alpha2[tile_], rgb_out[tile_], alpha_out[tile_])
+
+        self.run(blend_tile, w, h)
+        del rgb_out, alpha_out
+        return to_surface(out) if out_ is None else out_
+
+    def blend_texture_add(self, surface1_: pygame.Surface, surface2_: pygame.Surface,
+                          set_alpha1_: (float, numpy.ndarray),
+                          set_alpha2_: (float, numpy.ndarray), mask_: bool = False,
+                          integer_: bool = False,
+                          out_: (pygame.Surface, numpy.ndarray) = None) -> (pygame.Surface, numpy.ndarray):
+        """
+        Tiled version of blend_texture_add (same arguments and result).
+
+        :param surface1_: First layer texture
+        :param surface2_: Second layer texture
+        :param set_alpha1_: Alpha values for surface1 (can be a float or a numpy array)
+        :param set_alpha2_: Alpha values for surface2 (can be a float or a numpy array)
+        :param mask_: True | False, create a mask from surface1 (only black pixels)
+        :param integer_: True | False, use the uint16 fixed point path instead of float64
+        :param out_: Optional destination, 32-bit Surface with per-pixel alpha or uint8 array (h, w, 4)
+        :return: Return a pygame surface (blend between surface1 & surface2) or out_
+        """
+        assert isinstance(surface1_, pygame.Surface), \
+            'Expecting Surface for argument surface got %s ' % type(surface1_)
+        assert isinstance(surface2_, pygame.Surface), \
+            'Expecting Surface for argument surface2_ got %s ' % type(surface2_)
+        assert isinstance(set_alpha1_, (float, numpy.ndarray)), \
+            'Expecting float or numpy.ndarray for argument set_alpha1_ got %s ' % type(set_alpha1_)
+        assert isinstance(set_alpha2_, (float, numpy.ndarray)), \
+            'Expecting float for argument set_alpha2_ got %s ' % type(set_alpha2_)
+
+        w, h = surface1_.get_size()
+        rgb1, surface_alpha1 = planes(surface1_)
+        rgb2, _ = planes(surface2_)
+        out = numpy.empty((h, w, 4), dtype=numpy.uint8) if out_ is None else out_
+        rgb_out, alpha_out = output_views(out, w, h)
+        if integer_:
+            set_alpha1_, set_alpha2_ = alpha_to_int(set_alpha1_), alpha_to_int(set_alpha2_)
+        else:
+            set_alpha1_, set_alpha2_ = alpha_to_float(set_alpha1_), alpha_to_float(set_alpha2_)
+
+        def blend_tile(tile_):
+            alpha1 = set_alpha1_[tile_] if isinstance(set_alpha1_, numpy.ndarray) else set_alpha1_
+            alpha2 = set_alpha2_[tile_] if isinstance(set_alpha2_, numpy.ndarray) else set_alpha2_
+            if integer_:
+                blend_texture_add_int(rgb1[tile_], alpha1, rgb2[tile_], alpha2, rgb_out[tile_], alpha_out[tile_])
+            else:
+                blend_texture_add_float((rgb1[tile_] / 255) * alpha1, alpha1, (rgb2[tile_] / 255) * alpha2, alpha2,
+                                        rgb_out[tile_], alpha_out[tile_])
+            if mask_:
+                mask_alpha1 = surface_alpha1[tile_] == 0
+                rgb_out[tile_][mask_alpha1] = 0
+                alpha_out[tile_][mask_alpha1] = 0
+
+        self.run(blend_tile, w, h)
+        del rgb_out, alpha_out
+        return to_surface(out) if out_ is None else out_
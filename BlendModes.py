@@ -0,0 +1,251 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Porter-Duff operators (over, in, out, atop, xor, plus) and separable blend modes
+(multiply, screen, additive), straight alpha in and out
+
+Porter-Duff, pre-multiplied colors (Sc = SrcRGB x SrcA, Dc = DstRGB x DstA):
+outC = Sc x Fa + Dc x Fb, outA = SrcA x Fa + DstA x Fb
+over    Fa = 1            Fb = 1 - SrcA
+in      Fa = DstA         Fb = 0
+out     Fa = 1 - DstA     Fb = 0
+atop    Fa = DstA         Fb = 1 - SrcA
+xor     Fa = 1 - DstA     Fb = 1 - SrcA
+plus    Fa = 1            Fb = 1            (clamped to 1)
+
+Separable modes, composited "over": outA = SrcA + DstA - SrcA x DstA
+multiply  outC = Sc x (1 - DstA) + Dc x (1 - SrcA) + Sc x Dc
+screen    outC = Sc + Dc - Sc x Dc
+additive  outC = Sc + Dc                    (clamped to 1)
+
+outRGB = outC / outA
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import numpy
+
+from Compositing import jit, stage, texture_size, planes, output_views, to_surface
+
+# Mode names, the index is the mode code of the kernels
+MODES = ('over', 'in', 'out', 'atop', 'xor', 'plus', 'multiply', 'screen', 'additive')
+
+# Rows blended at a time by blend_modes_numpy (float temporaries of a strip only)
+STRIP = 32
+
+
+def blend_modes_loop(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                     rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                     rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray, mode_: int) -> None:
+    """
+    Blend mode looping over all pixels, each pixel is read and written once (no temporary arrays).
+    Output values are rounded to the nearest 8-bit value (identity cases, e.g. "in" over an opaque
+    destination, return the source unchanged).
+    Compiled with numba when available (blend_modes_fused), very slow otherwise.
+
+    :param rgb1_: uint8 array (h, w, 3), source RGB values
+    :param alpha1_: uint8 array (h, w), source alpha values
+    :param rgb2_: uint8 array (h, w, 3), destination RGB values
+    :param alpha2_: uint8 array (h, w), destination alpha values
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :param mode_: Mode code (index in MODES)
+    :return: None
+    """
+    h, w = alpha1_.shape
+    for j in range(h):
+        for i in range(w):
+            sa = alpha1_[j, i] / 255
+            da = alpha2_[j, i] / 255
+
+            # Porter-Duff fractions
+            fa, fb = 1.0, 1.0 - sa
+            if mode_ == 1:
+                fa, fb = da, 0.0
+            elif mode_ == 2:
+                fa, fb = 1.0 - da, 0.0
+            elif mode_ == 3:
+                fa = da
+            elif mode_ == 4:
+                fa = 1.0 - da
+            elif mode_ == 5:
+                fb = 1.0
+
+            if mode_ <= 5:
+                alpha = min(sa * fa + da * fb, 1.0)
+            else:
+                alpha = sa + da - sa * da
+            alpha_out_[j, i] = int(alpha * 255 + 0.5)
+
+            for c in range(3):
+                sc = rgb1_[j, i, c] / 255 * sa
+                dc = rgb2_[j, i, c] / 255 * da
+                if mode_ <= 5:
+                    value = sc * fa + dc * fb
+                elif mode_ == 6:
+                    value = sc * (1.0 - da) + dc * (1.0 - sa) + sc * dc
+                elif mode_ == 7:
+                    value = sc + dc - sc * dc
+                else:
+                    value = sc + dc
+                rgb = 0.0
+                if alpha > 0:
+                    rgb = min(value / alpha, 1.0)
+                rgb_out_[j, i, c] = int(rgb * 255 + 0.5)
+
+
+def blend_modes_numpy(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                      rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                      rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray, mode_: int) -> None:
+    """
+    Vectorised blend_modes_loop, STRIP rows at a time (same arithmetic).
+
+    :param rgb1_: uint8 array (h, w, 3), source RGB values
+    :param alpha1_: uint8 array (h, w), source alpha values
+    :param rgb2_: uint8 array (h, w, 3), destination RGB values
+    :param alpha2_: uint8 array (h, w), destination alpha values
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :param mode_: Mode code (index in MODES)
+    :return: None
+    """
+    for y in range(0, alpha1_.shape[0], STRIP):
+        rows = slice(y, y + STRIP)
+        sa = alpha1_[rows, :, numpy.newaxis] / 255
+        da = alpha2_[rows, :, numpy.newaxis] / 255
+        sc = rgb1_[rows] / 255 * sa
+        dc = rgb2_[rows] / 255 * da
+
+        if mode_ <= 5:
+            fa, fb = 1.0, 1.0 - sa
+            if mode_ == 1:
+                fa, fb = da, 0.0
+            elif mode_ == 2:
+                fa, fb = 1.0 - da, 0.0
+            elif mode_ == 3:
+                fa = da
+            elif mode_ == 4:
+                fa = 1.0 - da
+            elif mode_ == 5:
+                fb = 1.0
+            alpha = numpy.minimum(sa * fa + da * fb, 1.0)
+            value = sc * fa + dc * fb
+        else:
+            alpha = sa + da - sa * da
+            if mode_ == 6:
+                value = sc * (1.0 - da) + dc * (1.0 - sa) + sc * dc
+            elif mode_ == 7:
+                value = sc + dc - sc * dc
+            else:
+                value = sc + dc
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            rgb = numpy.where(alpha > 0, numpy.minimum(value / alpha, 1.0), 0.0)
+        # Rounded to the nearest 8-bit value
+        rgb_out_[rows] = rgb * 255 + 0.5
+        alpha_out_[rows] = alpha[:, :, 0] * 255 + 0.5
+
+
+def blend_modes_fused(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                      rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                      rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray, mode_: int) -> None:
+    """
+    blend_modes_loop compiled with numba on first call (see Compositing.jit). Without numba
+    the strip kernel is used instead of the (slow) python loop, same result.
+
+    :param rgb1_: uint8 array (h, w, 3), source RGB values
+    :param alpha1_: uint8 array (h, w), source alpha values
+    :param rgb2_: uint8 array (h, w, 3), destination RGB values
+    :param alpha2_: uint8 array (h, w), destination alpha values
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :param mode_: Mode code (index in MODES)
+    :return: None
+    """
+    kernel = jit(blend_modes_loop) or blend_modes_numpy
+    kernel(rgb1_, alpha1_, rgb2_, alpha2_, rgb_out_, alpha_out_, mode_)
+
+
+def composite(texture1_, texture2_, mode_: str = 'over', out_=None):
+    """
+    Composite texture1 (source) with texture2 (destination), see MODES.
+
+    :param texture1_: Source, uint8 array (h, w, 4) RGBA or 32-bit Surface
+    :param texture2_: Destination, uint8 array (h, w, 4) RGBA or 32-bit Surface
+    :param mode_: Mode name (see MODES)
+    :param out_: Optional destination, uint8 array (h, w, 4) or 32-bit Surface with per-pixel alpha
+    :return: Return a new uint8 array (h, w, 4) RGBA or out_
+    """
+    assert mode_ in MODES, \
+        'Expecting one of %s for argument mode_ got %s ' % (', '.join(MODES), mode_)
+    w, h = texture_size(texture1_)
+    assert texture_size(texture2_) == (w, h), \
+        'Expecting textures with the same size got %s and %s ' % ((w, h), texture_size(texture2_))
+
+    out = numpy.empty((h, w, 4), dtype=numpy.uint8) if out_ is None else out_
+    rgb_out, alpha_out = output_views(out, w, h)
+    rgb1, alpha1 = planes(texture1_)
+    rgb2, alpha2 = planes(texture2_)
+    with stage('composite.blend'):
+        blend_modes_fused(rgb1, alpha1, rgb2, alpha2, rgb_out, alpha_out, MODES.index(mode_))
+    return out
+
+
+def blend_mode(surface1_, surface2_, mode_: str = 'over', out_=None):
+    """
+    Blend surface1 (source) with surface2 (destination) with a Porter-Duff operator or a blend mode.
+
+    :param surface1_: First layer texture (source)
+    :param surface2_: Second layer texture (destination)
+    :param mode_: 'over', 'in', 'out', 'atop', 'xor', 'plus', 'multiply', 'screen' or 'additive'
+    :param out_: Optional destination, 32-bit Surface with per-pixel alpha or uint8 array (h, w, 4).
+    The blend is written in place and out_ is returned (no new Surface)
+    :return: Return a pygame surface (blend between surface1 & surface2) or out_
+    """
+    out = composite(surface1_, surface2_, mode_, out_)
+    return to_surface(out) if out_ is None else out_
+
+
+if __name__ == '__main__':
+    # Identity cases, exact with both kernels: python BlendModes.py
+    rng = numpy.random.default_rng(0)
+    source = rng.integers(0, 256, (256, 255, 4), dtype=numpy.uint8)
+    source[:, :, 3] = numpy.arange(255, dtype=numpy.uint8) + 1
+    opaque = rng.integers(0, 256, source.shape, dtype=numpy.uint8)
+    opaque[:, :, 3] = 255
+    transparent = numpy.zeros_like(source)
+
+    for name, kernel in (('blend_modes_fused', blend_modes_fused), ('blend_modes_numpy', blend_modes_numpy)):
+        cases = [('in', source, opaque, source), ('over', source, transparent, source),
+                 ('over', transparent, opaque, opaque)]
+        cases += [(mode, source, transparent, source) for mode in ('out', 'xor', 'plus', 'multiply',
+                                                                   'screen', 'additive')]
+        for mode, texture1, texture2, expected in cases:
+            out = numpy.empty_like(source)
+            kernel(texture1[:, :, :3], texture1[:, :, 3], texture2[:, :, :3], texture2[:, :, 3],
+                   out[:, :, :3], out[:, :, 3], MODES.index(mode))
+            assert (out == expected).all(), \
+                '%s: %s is not exact, %s pixels differ ' % (name, mode, (out != expected).any(2).sum())
+        print('%s: %s identity cases exact' % (name, len(cases)))
@@ -32,85 +32,159 @@ import pygame
 import numpy
 import timeit
 
+from TextureCache import TextureCache
+from BlendWorkspace import BlendWorkspace
+from RenderLoop import RenderLoop
+from PremultipliedTexture import PremultipliedTexture, blend_premultiplied
+from MaskPyramid import MaskRegistry
+from Compositing import stage, blend_add, planes, to_surface, alpha_to_int, alpha_to_float, \
+    blend_texture_add_int, blend_texture_add_float
 
-def blend_texture_add(surface1_: pygame.Surface, surface2_: pygame.Surface,
+
+def blend_texture_add(surface1_: (pygame.Surface, PremultipliedTexture),
+                      surface2_: (pygame.Surface, PremultipliedTexture),
                       set_alpha1_: (float, numpy.ndarray),
-                      set_alpha2_: (float, numpy.ndarray), mask_: bool = False) -> pygame.Surface:
+                      set_alpha2_: (float, numpy.ndarray), mask_: bool = False,
+                      integer_: bool = False,
+                      out_: (pygame.Surface, numpy.ndarray, PremultipliedTexture) = None,
+                      cache_: TextureCache = None,
+                      workspace_: BlendWorkspace = None) -> (pygame.Surface, numpy.ndarray):
     """
+    A PremultipliedTexture layer is blended as converted (e.g. PremultipliedTexture(surface1, set_alpha1)),
+    its set_alpha is an extra opacity (float, 1.0 no conversion per call).
 
-    :param surface1_: First layer texture
-    :param surface2_: Second layer texture
+    :param surface1_: First layer texture (Surface or PremultipliedTexture)
+    :param surface2_: Second layer texture (Surface or PremultipliedTexture)
     :param set_alpha1_: Alpha values for surface1 (can be a float or a numpy array)
     :param set_alpha2_: Alpha values for surface2 (can be a flaot or a numpy array)
     :param mask_: True | False, create a mask from surface1 (only black pixels)
-    :return: Return a pygame surface (blend between surface1 & surface2)
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    (result within +/-1 of the float path)
+    :param out_: Optional destination, 32-bit Surface with per-pixel alpha or uint8 array (h, w, 4)
+    (or PremultipliedTexture with pre-multiplied layers).
+    The blend is written in place and out_ is returned (no new Surface), the float path still allocates
+    its float temporaries on each call unless workspace_ is given
+    :param cache_: Optional TextureCache, re-use the planes and mask extracted from the surfaces
+    (and the pre-multiplied planes for a given alpha) by previous calls
+    :param workspace_: Optional BlendWorkspace, float path computed in re-used scratch buffers (same result
+    with the default float64 precision, within +/-1 with an opt-in float32 workspace)
+    :return: Return a pygame surface (blend between surface1 & surface2) or out_
     """
 
-    assert isinstance(surface1_, pygame.Surface), \
-        'Expecting Surface for argument surface got %s ' % type(surface1_)
-    assert isinstance(surface2_, pygame.Surface), \
-        'Expecting Surface for argument surface2_ got %s ' % type(surface2_)
+    assert isinstance(surface1_, (pygame.Surface, PremultipliedTexture)), \
+        'Expecting Surface or PremultipliedTexture for argument surface got %s ' % type(surface1_)
+    assert isinstance(surface2_, (pygame.Surface, PremultipliedTexture)), \
+        'Expecting Surface or PremultipliedTexture for argument surface2_ got %s ' % type(surface2_)
     assert isinstance(set_alpha1_, (float, numpy.ndarray)), \
         'Expecting float or numpy.ndarray for argument set_alpha1_ got %s ' % type(set_alpha1_)
     assert isinstance(set_alpha2_, (float, numpy.ndarray)), \
         'Expecting float for argument set_alpha2_ got %s ' % type(set_alpha2_)
 
-    # sizes
-    w, h = surface1_.get_width(), surface1_.get_height()
-
-    # Create a BufferProxy for surface1_ and 2
-    # '3' returns a (surface-width, surface-height, 3) array of RGB color components.
-    #  Each of the red, green, and blue components are unsigned bytes.
-    # Only 24-bit and 32-bit surfaces are supported.
-    # The color components must be in either RGB or BGR order within the pixel.
-    buffer1 = surface1_.get_view('3')
-    buffer2 = surface2_.get_view('3')
-
-    # Extract the alpha channel from surface1 and create
-    # a mask (array with black pixels flagged) alpha1_ <= 0
-    if isinstance(mask_, bool):
-        # Extract the surface1_ alpha channel and create a mask_ for (black pixel)
-        alpha1_ = numpy.array(surface1_.get_view('a'), dtype=numpy.uint8).transpose(1, 0) / 255
-        mask_alpha1 = alpha1_ <= 0
-
-    if isinstance(set_alpha1_, float):
-        # Create alpha channels alpha1 and alpha2
-        alpha1 = numpy.full((w, h, 1), set_alpha1_).transpose(1, 0, 2)
-    elif isinstance(set_alpha1_, numpy.ndarray):
-        alpha1 = set_alpha1_
-
-    if isinstance(set_alpha2_, float):
-        # Create alpha channels alpha1 and alpha2
-        alpha2 = numpy.full((w, h, 1), set_alpha2_).transpose(1, 0, 2)
-    elif isinstance(set_alpha2_, numpy.ndarray):
-        alpha2 = set_alpha2_
-
-    # -------------------  pre-multiplied -------------------
-    # 1) create arrays representing surface1_ and surface2_, swap row and column and normalize.
-    # 2 ) pre - multiplied alphas
-    rgb1 = (numpy.array(buffer1, dtype=numpy.uint8).transpose(1, 0, 2) / 255) * alpha1
-    rgb2 = (numpy.array(buffer2, dtype=numpy.uint8).transpose(1, 0, 2) / 255) * alpha2
-
-    # create the output array RGBA
-    new = numpy.zeros((w, h, 4))
-
-    # Calculations for RGB values -> outRGB = SrcRGB + DstRGB(1 - SrcA)
-    new[:, :, :3] = numpy.add(rgb1, rgb2 * (1 - alpha1))
-    # Calculation for alpha channel -> outA = SrcA + DstA(1 - SrcA)
-    new[:, :, 3] = numpy.add(alpha1, alpha2 * (1 - alpha1)).reshape(w, h)
-    # -------------------  pre-multiplied -------------------
-
-    # De-normalization
-    new = numpy.multiply(new, 255)
-
-    # Capping all the values over 255
-    numpy.putmask(new, new > 255, 255)
-
-    # Apply the mask_ to the new surface
-    if mask_:
-        new[mask_alpha1] = 0
-    return pygame.image.frombuffer(new.copy('C').astype(numpy.uint8),
-                                   (w, h), 'RGBA')
+    if isinstance(surface1_, PremultipliedTexture) or isinstance(surface2_, PremultipliedTexture):
+        # Straight layers pre-multiplied on the fly by their set_alpha (opacity 1.0 in the blend)
+        layers = [(surface, set_alpha) if isinstance(surface, PremultipliedTexture)
+                  else (PremultipliedTexture(surface, set_alpha, not integer_), 1.0)
+                  for surface, set_alpha in ((surface1_, set_alpha1_), (surface2_, set_alpha2_))]
+        w, h = layers[0][0].size
+        out = blend_premultiplied(layers[0][0], layers[1][0], layers[0][1], layers[1][1], mask_, integer_,
+                                  numpy.empty((h, w, 4), dtype=numpy.uint8) if out_ is None else out_,
+                                  workspace_)
+        return to_surface(out) if out_ is None else out_
+
+    # Planes referenced without copy, blended into out_ (or a new RGBA array)
+    out = blend_add(surface1_, surface2_, set_alpha1_, set_alpha2_, mask_, integer_, out_, cache_, workspace_)
+    if out_ is not None:
+        return out_
+    with stage('blend_texture_add.to_surface'):
+        return to_surface(out)
+
+
+def blend_texture_batch(surface1_: (pygame.Surface, numpy.ndarray), surface2_: pygame.Surface,
+                        set_alpha1_: (float, list, numpy.ndarray),
+                        set_alpha2_: (float, numpy.ndarray), mask_: bool = False,
+                        integer_: bool = False, chunk_: int = 16,
+                        out_: numpy.ndarray = None) -> numpy.ndarray:
+    """
+    Blend a stack of frames in one call (offline rendering of a transition sequence).
+
+    Frame k is blend_texture_add(frame1[k], surface2_, alpha1[k], set_alpha2_, mask_), computed
+    chunk_ frames at a time with the same kernels (same result than the individual calls).
+    surface2_ is extracted and pre-multiplied once, memory is bounded by chunk_ frames.
+
+    :param surface1_: First layer texture, Surface or stack of frames uint8 array (n, h, w, 4) RGBA
+    :param surface2_: Second layer texture
+    :param set_alpha1_: Alpha value(s) for surface1, float or sequence of n floats (one per frame)
+    :param set_alpha2_: Alpha values for surface2, float or numpy array (h, w, 1) (same for every frame)
+    :param mask_: True | False, create a mask from surface1 (only black pixels)
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    :param chunk_: Number of frames blended per numpy operation
+    :param out_: Optional uint8 array (n, h, w, 4) receiving the frames
+    :return: Return a uint8 array (n, h, w, 4) RGBA, the blended frames
+    """
+    assert isinstance(surface1_, (pygame.Surface, numpy.ndarray)), \
+        'Expecting Surface or numpy.ndarray for argument surface1_ got %s ' % type(surface1_)
+    assert isinstance(surface2_, pygame.Surface), \
+        'Expecting Surface for argument surface2_ got %s ' % type(surface2_)
+    assert isinstance(set_alpha1_, (float, list, tuple, numpy.ndarray)), \
+        'Expecting float or sequence for argument set_alpha1_ got %s ' % type(set_alpha1_)
+    assert isinstance(set_alpha2_, (float, numpy.ndarray)), \
+        'Expecting float or numpy.ndarray for argument set_alpha2_ got %s ' % type(set_alpha2_)
+    assert numpy.ndim(set_alpha1_) <= 1, \
+        'Expecting float or sequence of floats (one per frame) for argument set_alpha1_ got shape %s ' % (
+            numpy.shape(set_alpha1_),)
+    assert numpy.ndim(set_alpha2_) in (0, 3), \
+        'Expecting float or numpy.ndarray (h, w, 1) for argument set_alpha2_ (same for every frame) got shape %s ' % (
+            numpy.shape(set_alpha2_),)
+    assert isinstance(chunk_, int) and chunk_ > 0, \
+        'Expecting positive int for argument chunk_ got %s ' % chunk_
+
+    w, h = surface2_.get_size()
+
+    # Foreground frames (n, h, w, 3) & alpha (n, h, w), a single surface is broadcast
+    if isinstance(surface1_, pygame.Surface):
+        rgb1, alpha1_ = planes(surface1_)
+        rgb1, alpha1_ = rgb1[numpy.newaxis], alpha1_[numpy.newaxis]
+    else:
+        assert surface1_.dtype == numpy.uint8 and surface1_.shape[1:] == (h, w, 4), \
+            'Expecting uint8 numpy.ndarray of shape (n, %s, %s, 4) for argument surface1_ ' % (h, w)
+        rgb1, alpha1_ = surface1_[..., :3], surface1_[..., 3]
+
+    # One alpha per frame
+    alpha1 = numpy.array(alpha_to_float(set_alpha1_), dtype=float).reshape(-1)
+    n = max(len(rgb1), len(alpha1))
+    assert len(rgb1) in (1, n) and len(alpha1) in (1, n), \
+        'Expecting the same number of frames for surface1_ and set_alpha1_ got %s and %s ' % (len(rgb1), len(alpha1))
+    alpha1 = numpy.broadcast_to(alpha1, (n,)).reshape(n, 1, 1, 1)
+
+    out = numpy.empty((n, h, w, 4), dtype=numpy.uint8) if out_ is None else out_
+    assert isinstance(out, numpy.ndarray) and out.dtype == numpy.uint8 and out.shape == (n, h, w, 4), \
+        'Expecting uint8 numpy.ndarray of shape %s for argument out_ ' % ((n, h, w, 4),)
+
+    rgb2, _ = planes(surface2_)
+    if integer_:
+        alpha1 = alpha_to_int(alpha1)
+        alpha2 = alpha_to_int(set_alpha2_)
+    else:
+        # Scalar alpha broadcast by numpy (no full size array)
+        alpha2 = alpha_to_float(set_alpha2_)
+        # DstRGB x DstA, identical for every frame
+        rgb2 = (rgb2 / 255) * alpha2
+
+    for start in range(0, n, chunk_):
+        frames = slice(start, min(start + chunk_, n))
+        chunk1 = rgb1[frames] if len(rgb1) > 1 else rgb1
+        if integer_:
+            blend_texture_add_int(chunk1, alpha1[frames], rgb2, alpha2,
+                                  out[frames, :, :, :3], out[frames, :, :, 3])
+        else:
+            blend_texture_add_float((chunk1 / 255) * alpha1[frames], alpha1[frames], rgb2, alpha2,
+                                    out[frames, :, :, :3], out[frames, :, :, 3])
+
+        # Apply the mask_ to the frames
+        if mask_:
+            mask_alpha1 = (alpha1_[frames] if len(alpha1_) > 1 else alpha1_) == 0
+            out[frames][numpy.broadcast_to(mask_alpha1, out[frames].shape[:3])] = 0
+    return out
 
 
 if __name__ == '__main__':
@@ -136,11 +210,10 @@ if __name__ == '__main__':
     # surface1_mask = numpy.repeat(gradient[:, numpy.newaxis], [surface1.get_height()], 1).reshape((256, 256, 1)) / 255
     # surface1_mask.transpose(1, 0, 2)
 
-    # Create an alpha channel from a the image radial1_inverted.png
-    mask = pygame.image.load('Assets\\radial1_inverted.png').convert_alpha()
-    mask = pygame.transform.smoothscale(mask, SIZE)
-    surface1_mask = pygame.surfarray.array_alpha(mask)
-    surface1_mask = surface1_mask.reshape((256, 256, 1)) / 255
+    # Create an alpha channel from a the image radial1_inverted.png (served at SIZE by the mask registry)
+    masks = MaskRegistry()
+    masks.register('radial1_inverted', 'Assets\\radial1_inverted.png')
+    surface1_mask = masks.get('radial1_inverted', SIZE)
     surface1_mask = 0.8
 
     """
@@ -158,17 +231,23 @@ if __name__ == '__main__':
     # Save the image
     pygame.image.save(texture, 'Assets\\Blend.png')
 
-    done = False
-    while not done:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                done = True
-        # Create a transition effect between 2 layers
-        # texture = blend_texture_add(surface1, surface2, i / 255, 255 / 255, mask_=True)
+    # surface1, surface2 and the alphas do not change, planes and mask are extracted once
+    cache = TextureCache()
+
+    # Create a transition effect between 2 layers
+    # texture = blend_texture_add(surface1, surface2, i / 255, 255 / 255, mask_=True)
 
-        # Blending
-        texture = blend_texture_add(surface1, surface2, surface1_mask, surface2_mask, mask_=True)
+    # Blending on the render thread, written in place into the two output surfaces in turn
+    loop = RenderLoop(lambda index_, texture_: blend_texture_add(
+        surface1, surface2, surface1_mask, surface2_mask, mask_=True, out_=texture_, cache_=cache), SIZE)
 
+    def present(texture_, index_):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
         screen.blit(background, (0, 0))
-        screen.blit(texture, (0, 0))
-        pygame.display.flip()
\ No newline at end of file
+        screen.blit(texture_, (0, 0))
+        pygame.display.flip()
+
+    loop.run(present)
+    print(loop.report())
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Scratch buffers of the float kernels, re-used from call to call (float32 or float64 precision)
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import threading
+
+import numpy
+
+PRECISIONS = ('float32', 'float64')
+
+
+class BlendWorkspace:
+    """
+    Preallocated scratch buffers and float kernels computing with out= arguments.
+
+    The methods alpha_blending, alpha_blending_opaque and blend_texture_add have the signature
+    of the Compositing float kernels, pass the workspace to alpha_blend / blend_add (workspace_)
+    to use them. Buffers grow to the largest size blended and are re-used for any smaller
+    region: repeated calls allocate no pixel memory (destination given with out_, alpha index cached).
+    float64 (default) gives the same result than the Compositing kernels, float32 is opt-in and
+    halves the memory traffic (result within +/-1).
+
+    A workspace is not thread safe, use one workspace per thread (see thread_workspace).
+    """
+
+    def __init__(self, precision_: str = 'float64'):
+        """
+        :param precision_: 'float64' (same result than the Compositing kernels) or 'float32' (within +/-1)
+        """
+        assert precision_ in PRECISIONS, \
+            'Expecting float32 or float64 for argument precision_ got %s ' % precision_
+        self.dtype = numpy.dtype(precision_)
+        self._buffers = {}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def clear(self) -> None:
+        """
+        Release the buffers.
+
+        :return: None
+        """
+        self._buffers.clear()
+
+    def buffer(self, name_: str, shape_: tuple) -> numpy.ndarray:
+        """
+        :param name_: Buffer name, one buffer per name
+        :param shape_: Shape requested
+        :return: Return a contiguous array of the workspace dtype (view of the buffer, content undefined)
+        """
+        size = int(numpy.prod(shape_))
+        buffer = self._buffers.get(name_)
+        if buffer is None or buffer.size < size:
+            buffer = self._buffers[name_] = numpy.empty(size, dtype=self.dtype)
+        return buffer[:size].reshape(shape_)
+
+    def normalize(self, name_: str, array_: numpy.ndarray) -> numpy.ndarray:
+        """
+        :param name_: Buffer name
+        :param array_: uint8 array
+        :return: Return array_ / 255 in a buffer
+        """
+        return numpy.divide(array_, 255, out=self.buffer(name_, array_.shape), dtype=self.dtype)
+
+    def premultiply(self, name_: str, rgb_: numpy.ndarray, alpha_: (float, numpy.ndarray)) -> numpy.ndarray:
+        """
+        Normalized and pre-multiplied RGB values, (rgb_ / 255) * alpha_.
+
+        :param name_: Buffer name
+        :param rgb_: uint8 array (h, w, 3)
+        :param alpha_: float or array broadcastable to (h, w, 1)
+        :return: Return a float array (h, w, 3) in a buffer
+        """
+        rgb = self.normalize(name_, rgb_)
+        return numpy.multiply(rgb, alpha_, out=rgb, dtype=self.dtype)
+
+    def alpha_blending(self, rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                       rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                       rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+        """
+        Straight alpha "over", see Compositing.alpha_blending_float.
+
+        :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+        :param alpha1_: uint8 array (h, w), foreground alpha values
+        :param rgb2_: uint8 array (h, w, 3), background RGB values
+        :param alpha2_: uint8 array (h, w), background alpha values
+        :param rgb_out_: uint8 array (h, w, 3), RGB destination
+        :param alpha_out_: uint8 array (h, w), alpha destination
+        :return: None
+        """
+        alpha1 = self.normalize('alpha1', alpha1_[:, :, numpy.newaxis])
+        inv_alpha1 = numpy.subtract(1, alpha1, out=self.buffer('inv_alpha1', alpha1.shape), dtype=self.dtype)
+
+        # outA = SrcA + DstA x (1 - SrcA)
+        alpha = self.normalize('alpha', alpha2_[:, :, numpy.newaxis])
+        rgb2 = self.normalize('rgb2', rgb2_)
+        numpy.multiply(rgb2, alpha, out=rgb2)
+        numpy.multiply(alpha, inv_alpha1, out=alpha)
+        numpy.add(alpha, alpha1, out=alpha)
+
+        # outRGB = (SrcRGB x SrcA + DstRGB x DstA x (1 - SrcA)) / outA
+        rgb = self.normalize('rgb1', rgb1_)
+        numpy.multiply(rgb, alpha1, out=rgb)
+        numpy.multiply(rgb2, inv_alpha1, out=rgb2)
+        numpy.add(rgb, rgb2, out=rgb)
+        numpy.divide(rgb, alpha, out=rgb)
+
+        # De-normalization, cast to uint8 straight into the destination
+        numpy.multiply(rgb, 255, out=rgb)
+        numpy.multiply(alpha, 255, out=alpha)
+        rgb_out_[...] = rgb
+        alpha_out_[...] = alpha[:, :, 0]
+
+    def alpha_blending_opaque(self, rgb1_: numpy.ndarray, alpha1_: numpy.ndarray, rgb2_: numpy.ndarray,
+                              rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+        """
+        Straight alpha "over" of an opaque background, see Compositing.alpha_blending_opaque_float.
+
+        :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+        :param alpha1_: uint8 array (h, w), foreground alpha values
+        :param rgb2_: uint8 array (h, w, 3), background RGB values (alpha 255 everywhere)
+        :param rgb_out_: uint8 array (h, w, 3), RGB destination
+        :param alpha_out_: uint8 array (h, w), alpha destination
+        :return: None
+        """
+        alpha1 = self.normalize('alpha1', alpha1_[:, :, numpy.newaxis])
+        # outRGB = SrcRGB x SrcA + DstRGB x (1 - SrcA)
+        rgb = self.normalize('rgb1', rgb1_)
+        numpy.multiply(rgb, alpha1, out=rgb)
+        numpy.subtract(1, alpha1, out=alpha1)
+        rgb2 = self.normalize('rgb2', rgb2_)
+        numpy.multiply(rgb2, alpha1, out=rgb2)
+        numpy.add(rgb, rgb2, out=rgb)
+
+        # De-normalization, cast to uint8 straight into the destination
+        numpy.multiply(rgb, 255, out=rgb)
+        rgb_out_[...] = rgb
+        alpha_out_[...] = 255
+
+    def blend_texture_add(self, rgb1_: numpy.ndarray, alpha1_: (float, numpy.ndarray),
+                          rgb2_: numpy.ndarray, alpha2_: (float, numpy.ndarray),
+                          rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+        """
+        Pre-multiplied "over", see Compositing.blend_texture_add_float.
+
+        :param rgb1_: float array (h, w, 3), first layer RGB values normalized and pre-multiplied by alpha1_
+        :param alpha1_: float or array broadcastable to (h, w, 1), alpha values for layer 1
+        :param rgb2_: float array (h, w, 3), second layer RGB values normalized and pre-multiplied by alpha2_
+        :param alpha2_: float or array broadcastable to (h, w, 1), alpha values for layer 2
+        :param rgb_out_: uint8 array (h, w, 3), RGB destination
+        :param alpha_out_: uint8 array (h, w), alpha destination
+        :return: None
+        """
+        if isinstance(alpha1_, numpy.ndarray):
+            inv_alpha1 = numpy.subtract(1, alpha1_, out=self.buffer('inv_alpha1', alpha1_.shape), dtype=self.dtype)
+        else:
+            inv_alpha1 = 1 - alpha1_
+
+        # outRGB = SrcRGB + DstRGB(1 - SrcA)
+        rgb = numpy.multiply(rgb2_, inv_alpha1, out=self.buffer('rgb', rgb2_.shape), dtype=self.dtype)
+        numpy.add(rgb1_, rgb, out=rgb, dtype=self.dtype)
+        numpy.multiply(rgb, 255, out=rgb)
+        numpy.minimum(rgb, 255, out=rgb)
+        rgb_out_[...] = rgb
+
+        # outA = SrcA + DstA(1 - SrcA)
+        if isinstance(alpha1_, numpy.ndarray) or isinstance(alpha2_, numpy.ndarray):
+            shape = numpy.broadcast_shapes(numpy.shape(alpha1_), numpy.shape(alpha2_))
+            alpha = numpy.multiply(alpha2_, inv_alpha1, out=self.buffer('alpha', shape), dtype=self.dtype)
+            numpy.add(alpha1_, alpha, out=alpha, dtype=self.dtype)
+            numpy.multiply(alpha, 255, out=alpha)
+            numpy.minimum(alpha, 255, out=alpha)
+            alpha_out_[..., numpy.newaxis] = alpha
+        else:
+            alpha_out_[...] = min((alpha1_ + alpha2_ * inv_alpha1) * 255, 255)
+
+
+_local = threading.local()
+
+
+def thread_workspace(precision_: str = 'float64') -> BlendWorkspace:
+    """
+    :param precision_: 'float64' or 'float32' (see BlendWorkspace)
+    :return: Return the workspace of the calling thread for this precision (created on first use)
+    """
+    workspaces = getattr(_local, 'workspaces', None)
+    if workspaces is None:
+        workspaces = _local.workspaces = {}
+    workspace = workspaces.get(precision_)
+    if workspace is None:
+        workspace = workspaces[precision_] = BlendWorkspace(precision_)
+    return workspace
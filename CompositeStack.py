@@ -0,0 +1,164 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Single pass compositing of N layers (front to back) with early opaque cutoff
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import pygame
+import numpy
+
+from Compositing import TILE, TRANSPARENT, MIXED, OPAQUE, alpha_tiles, alpha_to_float, output_views, planes, \
+    texture_size, tile_kinds, tile_runs, to_surface
+
+# Accumulated alpha above which a pixel is considered opaque (float rounding of 1.0)
+OPAQUE_ALPHA = 1.0 - 1e-9
+
+# States of the accumulation tiles, nothing accumulated, partially covered, opaque (finished)
+EMPTY, PARTIAL, DONE = 0, 1, 2
+# Tiles of a layer left out of the accumulation (transparent layer tile or finished tile)
+SKIP = 6
+
+
+def layer_planes(texture_: (pygame.Surface, numpy.ndarray)) -> tuple:
+    """
+    Reference the RGB and alpha planes of a layer (no copy).
+
+    :param texture_: 32-bit pygame Surface with per-pixel alpha or uint8 array (h, w, 4) RGBA
+    :return: Return a tuple ((w, h), uint8 RGB view (h, w, 3), uint8 alpha view (h, w))
+    """
+    assert isinstance(texture_, (pygame.Surface, numpy.ndarray)), \
+        'Expecting Surface or uint8 numpy.ndarray (h, w, 4) for a layer got %s ' % type(texture_)
+    w, h = texture_size(texture_)
+    rgb, alpha = planes(texture_)
+    return (w, h), rgb, alpha
+
+
+def composite_stack(layers_: list, out_: (pygame.Surface, numpy.ndarray) = None) -> (pygame.Surface, numpy.ndarray):
+    """
+    Composite a list of layers in one accumulation buffer ("over" operator, straight alpha output).
+
+    Layers are walked front to back (layers_[0] is the top layer) with the pre-multiplied "under" operator:
+    accRGB = accRGB + (1 - accA) x SrcA x SrcRGB
+    accA = accA + (1 - accA) x SrcA
+    The work is done per tile (see Compositing.alpha_tiles): the transparent tiles of a layer are
+    skipped, an opaque tile finishes the accumulation and the layers below are not read
+    where the accumulation is already opaque.
+    The result is truncated to 8 bits once, without the intermediate images. Chaining
+    alpha_blending(top, alpha_blending(middle, bottom)) truncates every intermediate image,
+    both results differ by up to about one unit per layer (4 measured with 8 layers).
+
+    :param layers_: list of layers, each a Surface / uint8 array (h, w, 4) or a tuple (layer, set_alpha_)
+    with set_alpha_ a float or a numpy array (h, w) | (h, w, 1) multiplying the layer alpha (opacity or mask,
+    uint8 arrays in range [0 ... 255])
+    :param out_: Optional destination, 32-bit Surface with per-pixel alpha or uint8 array (h, w, 4)
+    :return: Return a pygame surface or out_
+    """
+    assert isinstance(layers_, (list, tuple)) and len(layers_) > 0, \
+        'Expecting non empty list for argument layers_ got %s ' % type(layers_)
+
+    size = None
+    acc_rgb = acc_alpha = state = None
+
+    for layer in layers_:
+        texture, set_alpha = layer if isinstance(layer, tuple) else (layer, 1.0)
+        assert isinstance(set_alpha, (float, numpy.ndarray)), \
+            'Expecting float or numpy.ndarray for a layer alpha got %s ' % type(set_alpha)
+        layer_size, rgb, alpha = layer_planes(texture)
+
+        if size is None:
+            size = w, h = layer_size
+            # accRGB (0 - 255 range, pre-multiplied) and accA (0.0 - 1.0 range)
+            acc_rgb = numpy.zeros((h, w, 3))
+            acc_alpha = numpy.zeros((h, w))
+            state = numpy.full(((h + TILE - 1) // TILE, (w + TILE - 1) // TILE), EMPTY, dtype=numpy.int8)
+        assert layer_size == size, \
+            'Expecting layers of size %s got %s ' % (size, layer_size)
+
+        if isinstance(set_alpha, numpy.ndarray):
+            set_alpha = alpha_to_float(set_alpha).reshape(h, w) / 255
+            opacity = False
+        elif set_alpha <= 0.0:
+            continue
+        else:
+            # Opaque tiles of the layer only with a full opacity
+            opacity = set_alpha >= 1.0
+            set_alpha = set_alpha / 255
+
+        # Work per tile, kind of the layer tile (MIXED or OPAQUE) x 3 + accumulation state
+        kinds = tile_kinds(alpha_tiles(texture, TILE))
+        if not opacity:
+            kinds[kinds == OPAQUE] = MIXED
+        work = numpy.where((kinds == TRANSPARENT) | (state == DONE), SKIP, (kinds - 1) * 3 + state)
+        if (work == SKIP).all():
+            continue
+
+        for code, region in tile_runs(work, TILE, w, h):
+            if code == SKIP:
+                continue
+            tiles = region[0].start // TILE, slice(region[1].start // TILE, (region[1].stop + TILE - 1) // TILE)
+            kind, tile_state = divmod(code, 3)
+            if kind:
+                # Opaque layer tiles, weight = 1 - accA and accA = 1
+                if tile_state == EMPTY:
+                    acc_rgb[region] = rgb[region]
+                else:
+                    weight = numpy.subtract(1.0, acc_alpha[region])
+                    acc_rgb[region] += rgb[region] * weight[:, :, numpy.newaxis]
+                acc_alpha[region] = 1.0
+                state[tiles] = DONE
+                continue
+
+            # (1 - accA) x SrcA
+            weight = numpy.multiply(alpha[region], set_alpha if isinstance(set_alpha, float) else set_alpha[region])
+            if tile_state == EMPTY:
+                numpy.multiply(rgb[region], weight[:, :, numpy.newaxis], out=acc_rgb[region])
+                acc_alpha[region] = weight
+                state[tiles] = PARTIAL
+            else:
+                weight *= 1.0 - acc_alpha[region]
+                acc_rgb[region] += rgb[region] * weight[:, :, numpy.newaxis]
+                acc_alpha[region] += weight
+                # Tiles finished by this layer (lowest accA of each tile)
+                low = acc_alpha[region].min(axis=0)
+                low = numpy.minimum.reduceat(low, numpy.arange(0, low.size, TILE))
+                state[tiles][low >= OPAQUE_ALPHA] = DONE
+
+        if (state == DONE).all():
+            break
+
+    # Straight alpha outRGB = accRGB / accA (0 where fully transparent, accRGB is 0 there)
+    numpy.divide(acc_rgb, acc_alpha[:, :, numpy.newaxis], out=acc_rgb, where=acc_alpha[:, :, numpy.newaxis] > 0)
+
+    # De-normalization
+    numpy.multiply(acc_alpha, 255, out=acc_alpha)
+
+    out = numpy.empty((h, w, 4), dtype=numpy.uint8) if out_ is None else out_
+    rgb_out, alpha_out = output_views(out, w, h)
+    rgb_out[...] = acc_rgb
+    alpha_out[...] = acc_alpha
+    del rgb_out, alpha_out
+    return to_surface(out) if out_ is None else out_
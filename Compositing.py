@@ -0,0 +1,823 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Alpha-Compositing core, array native (uint8 RGBA arrays (h, w, 4)).
+
+pygame is not imported by this module, Surfaces are accepted wherever a texture is expected
+(referenced without copy through get_view) and pygame is only imported by to_surface.
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import contextlib
+
+import numpy
+
+# Default kernel of alpha_blend (see set_kernel)
+KERNEL = 'numpy'
+
+# Tile size (pixels) of the sparse alpha index (see alpha_tiles)
+TILE = 64
+
+# Kinds of tiles (see tile_kinds)
+TRANSPARENT, MIXED, OPAQUE = 0, 1, 2
+
+# Reciprocals of the 8-bit alpha values (see reciprocal_table), built on first use
+_RECIPROCAL = None
+# Kernel results for a transparent foreground (see transparent_table), built on first use per kernel
+_TRANSPARENT = {}
+
+# Optional numba module, imported on first use of a fused kernel (see jit), False when not installed
+_NUMBA = None
+# Per-pixel loops compiled by jit
+_COMPILED = {}
+
+# Active stage profiler (see Profiling.StageProfiler), None when profiling is disabled
+PROFILER = None
+_NO_STAGE = contextlib.nullcontext()
+
+
+def stage(name_: str):
+    """
+    Stage of a blend function timed by the active profiler.
+
+    :param name_: Stage name, e.g. 'alpha_blend.blend'
+    :return: Return a context manager (a shared no-op one when profiling is disabled)
+    """
+    return _NO_STAGE if PROFILER is None else PROFILER.stage(name_)
+
+
+def jit(function_):
+    """
+    Compile a per-pixel loop with numba (nogil), numba is imported on first use only
+    (the import takes longer than loading numpy and this module).
+
+    :param function_: Python loop, e.g. alpha_blending_loop
+    :return: Return the compiled function (compiled once) or None when numba is not installed
+    """
+    global _NUMBA
+    if _NUMBA is None:
+        try:
+            import numba
+            _NUMBA = numba
+        except ImportError:
+            _NUMBA = False
+    if _NUMBA is False:
+        return None
+    compiled = _COMPILED.get(function_)
+    if compiled is None:
+        compiled = _COMPILED[function_] = _NUMBA.njit(nogil=True, cache=True)(function_)
+    return compiled
+
+
+def texture_size(texture_) -> tuple:
+    """
+    :param texture_: 32-bit pygame Surface with per-pixel alpha or uint8 numpy array (h, w, 4) RGBA
+    :return: Return the texture size (w, h)
+    """
+    if isinstance(texture_, numpy.ndarray):
+        return texture_.shape[1], texture_.shape[0]
+    return texture_.get_size()
+
+
+def planes(texture_) -> tuple:
+    """
+    Reference the RGB values and alpha channel of a texture without copy (rows, columns).
+
+    Surfaces are referenced through a BufferProxy, '3' is a (surface-width, surface-height, 3)
+    view of the RGB color components (24-bit and 32-bit surfaces only, RGB or BGR order),
+    the surface stays locked as long as the views exist.
+
+    :param texture_: 32-bit pygame Surface with per-pixel alpha or uint8 numpy array (h, w, 4) RGBA
+    :return: Return a tuple (uint8 RGB view (h, w, 3), uint8 alpha view (h, w))
+    """
+    if isinstance(texture_, numpy.ndarray):
+        assert texture_.dtype == numpy.uint8 and texture_.ndim == 3 and texture_.shape[2] == 4, \
+            'Expecting uint8 numpy.ndarray (h, w, 4) for a texture got %s %s ' % (texture_.dtype, texture_.shape)
+        return texture_[:, :, :3], texture_[:, :, 3]
+    return numpy.asarray(texture_.get_view('3')).transpose(1, 0, 2), \
+        numpy.asarray(texture_.get_view('a')).transpose(1, 0)
+
+
+def alpha_tiles(texture_, tile_: int = TILE, cache_=None) -> numpy.ndarray:
+    """
+    Sparse index of the alpha channel, lowest and highest alpha value of every tile.
+
+    :param texture_: 32-bit pygame Surface with per-pixel alpha or uint8 numpy array (h, w, 4) RGBA
+    :param tile_: Tile size (pixels), the last row and column of tiles can be smaller
+    :param cache_: Optional TextureCache, the index is built once per texture (and contents version)
+    :return: Return a uint8 array (2, rows, columns), min and max alpha of each tile
+    """
+    if cache_ is not None:
+        return cache_.alpha_tiles(texture_, tile_)
+    alpha = planes(texture_)[1]
+    h, w = alpha.shape
+    rows = numpy.arange(0, h, tile_)
+    columns = numpy.arange(0, w, tile_)
+    return numpy.stack((
+        numpy.minimum.reduceat(numpy.minimum.reduceat(alpha, rows, axis=0), columns, axis=1),
+        numpy.maximum.reduceat(numpy.maximum.reduceat(alpha, rows, axis=0), columns, axis=1)))
+
+
+def alpha_range(texture_, cache_=None) -> tuple:
+    """
+    Lowest and highest alpha values of a texture, used to select the fast paths
+    (255, 255) fully opaque, (0, 0) fully transparent.
+
+    :param texture_: 32-bit pygame Surface with per-pixel alpha or uint8 numpy array (h, w, 4) RGBA
+    :param cache_: Optional TextureCache, the range is computed once per texture (and contents version)
+    :return: Return a tuple of int (min, max)
+    """
+    low, high = alpha_tiles(texture_, TILE, cache_)
+    return int(low.min()), int(high.max())
+
+
+def tile_kinds(tiles_: numpy.ndarray) -> numpy.ndarray:
+    """
+    :param tiles_: Sparse alpha index (see alpha_tiles)
+    :return: Return an array (rows, columns), TRANSPARENT (alpha 0), OPAQUE (alpha 255) or MIXED tiles
+    """
+    low, high = tiles_
+    return numpy.where(high == 0, TRANSPARENT, numpy.where(low == 255, OPAQUE, MIXED))
+
+
+def tile_runs(kinds_: numpy.ndarray, tile_: int, w: int, h: int) -> list:
+    """
+    Merge the consecutive tiles of the same kind on each row of tiles.
+
+    :param kinds_: Array (rows, columns) of tile kinds (see tile_kinds)
+    :param tile_: Tile size (pixels)
+    :param w: width
+    :param h: height
+    :return: Return a list of tuples (kind, (rows slice, columns slice))
+    """
+    runs = []
+    for j, row in enumerate(kinds_):
+        # Start of each run, where the kind changes along the row
+        starts = numpy.flatnonzero(numpy.diff(row, prepend=-1))
+        ends = numpy.append(starts[1:], len(row))
+        rows = slice(j * tile_, min((j + 1) * tile_, h))
+        for start, end in zip(starts, ends):
+            runs.append((row[start], (rows, slice(start * tile_, min(end * tile_, w)))))
+    return runs
+
+
+def output_views(out_, w: int, h: int) -> tuple:
+    """
+    Return the RGB and alpha views (rows, columns) of the blend destination.
+    A Surface is referenced through the same views as surfarray.pixels3d & pixels_alpha (no copy),
+    the surface stays locked as long as the views exist.
+
+    :param out_: 32-bit pygame Surface with per-pixel alpha or uint8 numpy array (h, w, 4)
+    :param w: width
+    :param h: height
+    :return: Return a tuple (RGB view (h, w, 3), alpha view (h, w))
+    """
+    if not isinstance(out_, numpy.ndarray):
+        assert out_.get_size() == (w, h), \
+            'Expecting Surface for argument out_ of size %s got %s ' % ((w, h), out_.get_size())
+        return numpy.asarray(out_.get_view('3')).transpose(1, 0, 2), \
+            numpy.asarray(out_.get_view('A')).transpose(1, 0)
+
+    assert out_.dtype == numpy.uint8 and out_.shape == (h, w, 4), \
+        'Expecting uint8 numpy.ndarray of shape %s for argument out_ ' % ((h, w, 4),)
+    return out_[:, :, :3], out_[:, :, 3]
+
+
+def to_surface(array_: numpy.ndarray):
+    """
+    pygame adapter, wrap a blend result into a Surface (pygame imported on first use).
+
+    :param array_: contiguous uint8 numpy array (h, w, 4) RGBA
+    :return: Return a pygame Surface sharing the array memory
+    """
+    import pygame
+    h, w = array_.shape[:2]
+    return pygame.image.frombuffer(array_, (w, h), 'RGBA')
+
+
+def rgba32(surface_):
+    """
+    Convert a loaded image to a 32-bit surface with per-pixel alpha (no display needed,
+    pygame imported on first use).
+
+    :param surface_: pygame Surface of any format (8, 24 or 32-bit)
+    :return: Return a 32-bit RGBA Surface (opaque alpha for images without alpha channel)
+    """
+    import pygame
+    if surface_.get_bitsize() == 32 and surface_.get_flags() & pygame.SRCALPHA:
+        return surface_
+    return pygame.image.fromstring(pygame.image.tostring(surface_, 'RGBA'), surface_.get_size(), 'RGBA')
+
+
+def div255(array_: numpy.ndarray) -> numpy.ndarray:
+    """
+    Fixed-point division by 255 with rounding, (x + 127) / 255, done in place.
+
+    :param array_: uint16 array holding products of two 8-bit values (x * a <= 65025)
+    :return: Return the same array, each value divided by 255 and rounded
+    """
+    numpy.add(array_, 127, out=array_)
+    numpy.floor_divide(array_, 255, out=array_)
+    return array_
+
+
+def alpha_to_int(set_alpha_: (float, numpy.ndarray)) -> (int, numpy.ndarray):
+    """
+    Convert a normalized alpha (float or array in range [0.0 ... 1.0]) to 8-bit fixed point.
+    uint8 arrays are considered already in range [0 ... 255] and returned as is (no copy,
+    e.g. MaskRegistry.get(..., uint8_=True) masks).
+
+    :param set_alpha_: Alpha value(s), float or numpy array
+    :return: Return an int, a uint16 array or the uint8 array in range [0 ... 255]
+    """
+    if isinstance(set_alpha_, numpy.ndarray):
+        if set_alpha_.dtype == numpy.uint8:
+            return set_alpha_
+        return (numpy.clip(set_alpha_, 0.0, 1.0) * 255 + 0.5).astype(numpy.uint16)
+    return int(min(max(set_alpha_, 0.0), 1.0) * 255 + 0.5)
+
+
+def alpha_to_float(set_alpha_: (float, numpy.ndarray)) -> (float, numpy.ndarray):
+    """
+    Normalized alpha for the float paths. uint8 arrays are considered in range [0 ... 255]
+    (see alpha_to_int) and divided by 255, other values are returned as is.
+
+    :param set_alpha_: Alpha value(s), float or numpy array
+    :return: Return set_alpha_ or a new float array in range [0.0 ... 1.0]
+    """
+    if isinstance(set_alpha_, numpy.ndarray) and set_alpha_.dtype == numpy.uint8:
+        return set_alpha_ / 255
+    return set_alpha_
+
+
+def reciprocal_table() -> numpy.ndarray:
+    """
+    Reciprocals of the 8-bit alpha values, shared by all calls (built on first use).
+    A division by an alpha becomes a lookup and a multiplication, x / a = (x * table[a]) >> 16
+    for x <= 255 x a (truncated, at most 1 above the division).
+
+    :return: Return a read only uint32 array (256,), ceil(65536 / a) and 0 for a = 0
+    """
+    global _RECIPROCAL
+    if _RECIPROCAL is None:
+        alpha = numpy.arange(1, 256, dtype=numpy.uint32)
+        table = numpy.zeros(256, dtype=numpy.uint32)
+        table[1:] = (65536 + alpha - 1) // alpha
+        table.flags.writeable = False
+        _RECIPROCAL = table
+    return _RECIPROCAL
+
+
+def transparent_table(kernel_, key_=None) -> numpy.ndarray:
+    """
+    RGB values written by a straight alpha kernel for a transparent foreground (SrcA = 0), for every
+    background alpha and RGB value (built once per kernel by calling it on all the pairs).
+    The kernels do not always return DstRGB: 0 when DstA = 0 and, for the float kernels,
+    DstRGB - 1 for some values (DstRGB / 255 x DstA / DstA x 255 truncated).
+
+    :param kernel_: Straight alpha kernel (rgb1, alpha1, rgb2, alpha2, rgb_out, alpha_out)
+    :param key_: Optional cache key (default kernel_), e.g. the precision of a workspace kernel
+    :return: Return a read only uint8 array (65536,), outRGB indexed by DstA x 256 + DstRGB
+    """
+    key = kernel_ if key_ is None else key_
+    table = _TRANSPARENT.get(key)
+    if table is None:
+        alpha2, rgb2 = numpy.indices((256, 256), dtype=numpy.uint8)
+        rgb2 = numpy.repeat(rgb2[:, :, numpy.newaxis], 3, axis=2)
+        alpha1 = numpy.zeros_like(alpha2)
+        rgb_out, alpha_out = numpy.empty_like(rgb2), numpy.empty_like(alpha2)
+        # 0 / 0 when both alphas are 0
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            kernel_(rgb2, alpha1, rgb2, alpha2, rgb_out, alpha_out)
+        table = rgb_out[:, :, 0].ravel()
+        table.flags.writeable = False
+        _TRANSPARENT[key] = table
+    return table
+
+
+def alpha_blending_int(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                       rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                       rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    Straight alpha "over" computed in fixed point (0 - 255 range).
+
+    Alpha weights are kept in uint16 (scaled by 255 x 255), only the RGB numerator
+    before the division by outA needs uint32.
+
+    :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+    :param alpha1_: uint8 array (h, w), foreground alpha values
+    :param rgb2_: uint8 array (h, w, 3), background RGB values
+    :param alpha2_: uint8 array (h, w), background alpha values
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    # SrcA and DstA x (1 - SrcA) scaled by 255 x 255
+    weight1 = numpy.multiply(alpha1_, 255, dtype=numpy.uint16)
+    weight2 = numpy.multiply(alpha2_, 255 - alpha1_, dtype=numpy.uint16)
+
+    # outRGB = (SrcRGB x SrcA + DstRGB x DstA x (1 - SrcA)) / outA
+    rgb = numpy.multiply(rgb1_, weight1[:, :, numpy.newaxis], dtype=numpy.uint32)
+    rgb += numpy.multiply(rgb2_, weight2[:, :, numpy.newaxis], dtype=numpy.uint32)
+
+    # outA = SrcA + DstA x (1 - SrcA), at most 255 x 255 (no overflow)
+    weight1 += weight2
+    # outA = 0 only when both layers are fully transparent (rgb is 0 as well)
+    numpy.floor_divide(rgb, numpy.maximum(weight1, 1)[:, :, numpy.newaxis], out=rgb)
+    rgb_out_[...] = rgb
+    # Values are truncated like the float path (astype(uint8))
+    alpha_out_[...] = numpy.floor_divide(weight1, 255, out=weight1)
+
+
+def alpha_blending_lut(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                       rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                       rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    Straight alpha "over" in 8-bit fixed point, the division by outA done with the reciprocal table
+    (see reciprocal_table, gathered with numpy.take) instead of a per-pixel integer division.
+
+    Weights are rounded to 8 bits (DstA x (1 - SrcA)), the result is within +/-4 of the
+    float path (+/-1 for most pixels, larger errors only at low outA).
+
+    :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+    :param alpha1_: uint8 array (h, w), foreground alpha values
+    :param rgb2_: uint8 array (h, w, 3), background RGB values
+    :param alpha2_: uint8 array (h, w), background alpha values
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    # DstA x (1 - SrcA), 8-bit
+    weight2 = div255(numpy.multiply(alpha2_, 255 - alpha1_, dtype=numpy.uint16))
+
+    # SrcRGB x SrcA + DstRGB x DstA x (1 - SrcA), at most 255 x outA (no overflow)
+    rgb = numpy.multiply(rgb1_, alpha1_[:, :, numpy.newaxis], dtype=numpy.uint16)
+    rgb += numpy.multiply(rgb2_, weight2[:, :, numpy.newaxis], dtype=numpy.uint16)
+
+    # outA = SrcA + DstA x (1 - SrcA), outRGB = rgb x (65536 / outA) >> 16 (65025 x 65536 fits uint32)
+    weight2 += alpha1_
+    rgb = numpy.multiply(rgb, numpy.take(reciprocal_table(), weight2)[:, :, numpy.newaxis], dtype=numpy.uint32)
+    numpy.right_shift(rgb, 16, out=rgb)
+    rgb_out_[...] = rgb
+    alpha_out_[...] = weight2
+
+
+def alpha_blending_float(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                         rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                         rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    Straight alpha "over" computed in float64 (0.0 - 1.0 range).
+
+    :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+    :param alpha1_: uint8 array (h, w), foreground alpha values
+    :param rgb2_: uint8 array (h, w, 3), background RGB values
+    :param alpha2_: uint8 array (h, w), background alpha values
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    h, w = alpha1_.shape
+
+    # Normalize RGB values (source -> rgb1, destination -> rgb2)
+    rgb1 = rgb1_ / 255
+    rgb2 = rgb2_ / 255
+
+    # create the output array RGBA (rows, columns)
+    new = numpy.zeros((h, w, 4))
+
+    # ---------------- background opaque (alpha_blending_opaque_float) ---
+    # alpha1 = (alpha1_ / 255)[:, :, numpy.newaxis]
+    # alpha2 = (alpha2_ / 255)[:, :, numpy.newaxis]
+    # new[:, :, 3] = 1  # outA
+    # new[:, :, :3] = (rgb1 * alpha1 + rgb2 * alpha2 * (1 - alpha1))  # outRGB
+
+    # ---------------- background partially transparent ------------
+    alpha1 = alpha1_ / 255
+    alpha2 = alpha2_ / 255
+    new[:, :, 3] = alpha1 + alpha2 * (1 - alpha1)
+    alpha1 = alpha1[:, :, numpy.newaxis]
+    alpha2 = alpha2[:, :, numpy.newaxis]
+    new[:, :, :3] = (rgb1 * alpha1 + rgb2 * alpha2 * (1 - alpha1)) / (alpha1 + alpha2 * (1 - alpha1))
+
+    # De-normalization
+    numpy.multiply(new, 255, out=new)
+
+    # Capping all the values over 255
+    # numpy.putmask(new, new > 255, 255)
+
+    # Cast to uint8 straight into the destination
+    rgb_out_[...] = new[:, :, :3]
+    alpha_out_[...] = new[:, :, 3]
+
+
+def alpha_blending_opaque_int(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray, rgb2_: numpy.ndarray,
+                              rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    alpha_blending_int for an opaque background (DstA = 1), outA = 1 and no division by outA.
+    Same result than alpha_blending_int (the 255 x 255 scale cancels out).
+
+    :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+    :param alpha1_: uint8 array (h, w), foreground alpha values
+    :param rgb2_: uint8 array (h, w, 3), background RGB values (alpha 255 everywhere)
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    # outRGB = SrcRGB x SrcA + DstRGB x (1 - SrcA), both weights sum up to 255 (no overflow)
+    rgb = numpy.multiply(rgb1_, alpha1_[:, :, numpy.newaxis], dtype=numpy.uint16)
+    rgb += numpy.multiply(rgb2_, (255 - alpha1_)[:, :, numpy.newaxis], dtype=numpy.uint16)
+    rgb_out_[...] = numpy.floor_divide(rgb, 255, out=rgb)
+    alpha_out_[...] = 255
+
+
+def alpha_blending_opaque_float(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray, rgb2_: numpy.ndarray,
+                                rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    alpha_blending_float for an opaque background (DstA = 1), outA = 1 and no division by outA.
+    Same operations with DstA = 1.0 (identical result).
+
+    :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+    :param alpha1_: uint8 array (h, w), foreground alpha values
+    :param rgb2_: uint8 array (h, w, 3), background RGB values (alpha 255 everywhere)
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    alpha1 = (alpha1_ / 255)[:, :, numpy.newaxis]
+    # outRGB = SrcRGB x SrcA + DstRGB x (1 - SrcA)
+    new = rgb1_ / 255 * alpha1
+    new += rgb2_ / 255 * (1 - alpha1)
+
+    # De-normalization, cast to uint8 straight into the destination
+    numpy.multiply(new, 255, out=new)
+    rgb_out_[...] = new
+    alpha_out_[...] = 255
+
+
+def alpha_blending_loop(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                        rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                        rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    Straight alpha "over" looping over all pixels, each pixel is read and written once
+    (no temporary arrays). Same arithmetic than alpha_blending_float (identical result).
+    Compiled with numba when available (alpha_blending_fused), very slow otherwise.
+
+    :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+    :param alpha1_: uint8 array (h, w), foreground alpha values
+    :param rgb2_: uint8 array (h, w, 3), background RGB values
+    :param alpha2_: uint8 array (h, w), background alpha values
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    h, w = alpha1_.shape
+    for j in range(h):
+        for i in range(w):
+            alpha1 = alpha1_[j, i] / 255
+            alpha2 = alpha2_[j, i] / 255
+            alpha = alpha1 + alpha2 * (1 - alpha1)
+            alpha_out_[j, i] = int(alpha * 255)
+            for c in range(3):
+                rgb = 0.0
+                if alpha > 0:
+                    rgb = (rgb1_[j, i, c] / 255 * alpha1 + rgb2_[j, i, c] / 255 * alpha2 * (1 - alpha1)) / alpha
+                rgb_out_[j, i, c] = int(rgb * 255)
+
+
+def alpha_blending_fused(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                         rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                         rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    alpha_blending_loop compiled with numba on first call (see jit). Without numba the
+    vectorised kernel is used instead of the (slow) python loop, same result.
+
+    :param rgb1_: uint8 array (h, w, 3), foreground RGB values
+    :param alpha1_: uint8 array (h, w), foreground alpha values
+    :param rgb2_: uint8 array (h, w, 3), background RGB values
+    :param alpha2_: uint8 array (h, w), background alpha values
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    kernel = jit(alpha_blending_loop) or alpha_blending_float
+    kernel(rgb1_, alpha1_, rgb2_, alpha2_, rgb_out_, alpha_out_)
+
+
+def set_kernel(kernel_: str) -> None:
+    """
+    Select the default float kernel of alpha_blend (and alpha_blending).
+
+    :param kernel_: 'numpy' (vectorised, alpha_blending_float), 'fused' (alpha_blending_fused, one pass
+    per pixel when numba is installed, numpy otherwise) or 'lut' (alpha_blending_lut, 8-bit fixed point
+    with a reciprocal table, also used when integer_ is False). The 'lut' result is within +/-4 of
+    the float path (+/-1 for most pixels, larger errors only at low outA)
+    :return: None
+    """
+    assert kernel_ in ('numpy', 'fused', 'lut'), \
+        'Expecting numpy, fused or lut for argument kernel_ got %s ' % kernel_
+    global KERNEL
+    KERNEL = kernel_
+
+
+def blend_texture_add_int(rgb1_: numpy.ndarray, alpha1_: (int, numpy.ndarray),
+                          rgb2_: numpy.ndarray, alpha2_: (int, numpy.ndarray),
+                          rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    Pre-multiplied "over" computed in fixed point (0 - 255 range), within +/-1 of the float path.
+    Element wise, arrays may have extra leading dimensions (stack of frames).
+
+    :param rgb1_: uint8 array (h, w, 3), first layer RGB values
+    :param alpha1_: int or uint16 array broadcastable to (h, w, 1), alpha values for layer 1
+    :param rgb2_: uint8 array (h, w, 3), second layer RGB values
+    :param alpha2_: int or uint16 array broadcastable to (h, w, 1), alpha values for layer 2
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    # SrcA and DstA x (1 - SrcA) scaled by 255 x 255 (as alpha_blending_int)
+    weight1 = numpy.multiply(alpha1_, 255, dtype=numpy.uint32)
+    weight2 = numpy.multiply(alpha2_, 255 - alpha1_, dtype=numpy.uint32)
+
+    # outRGB = SrcRGB x SrcA + DstRGB x DstA x (1 - SrcA), kept in uint32 (at most 255 x 255 x 255)
+    # and divided once by 255 x 255. Truncated like the float path (astype(uint8)).
+    rgb = numpy.multiply(rgb1_, weight1, dtype=numpy.uint32)
+    rgb2 = numpy.multiply(rgb2_, weight2, dtype=numpy.uint32)
+    # Sum in place, unless broadcast over a stack of frames
+    rgb = numpy.add(rgb, rgb2, out=rgb2 if rgb2.shape == numpy.broadcast_shapes(rgb.shape, rgb2.shape) else None)
+    numpy.floor_divide(rgb, 65025, out=rgb)
+    rgb_out_[...] = rgb
+
+    # outA = SrcA + DstA(1 - SrcA), at most 255 x 255
+    alpha = numpy.atleast_1d(numpy.add(weight1, weight2, dtype=numpy.uint32))
+    alpha_out_[..., numpy.newaxis] = numpy.floor_divide(alpha, 255, out=alpha)
+
+
+def blend_texture_add_float(rgb1_: numpy.ndarray, alpha1_: (float, numpy.ndarray),
+                            rgb2_: numpy.ndarray, alpha2_: (float, numpy.ndarray),
+                            rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    Pre-multiplied "over" computed in float64 (0.0 - 1.0 range).
+    Element wise, arrays may have extra leading dimensions (stack of frames).
+
+    :param rgb1_: float array (h, w, 3), first layer RGB values normalized and pre-multiplied by alpha1_
+    :param alpha1_: float or array broadcastable to (h, w, 1), alpha values for layer 1
+    :param rgb2_: float array (h, w, 3), second layer RGB values normalized and pre-multiplied by alpha2_
+    :param alpha2_: float or array broadcastable to (h, w, 1), alpha values for layer 2
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    # create the output array RGBA (rows, columns)
+    new = numpy.zeros(rgb1_.shape[:-1] + (4,))
+
+    # -------------------  pre-multiplied -------------------
+    # Calculations for RGB values -> outRGB = SrcRGB + DstRGB(1 - SrcA)
+    new[..., :3] = numpy.add(rgb1_, rgb2_ * (1 - alpha1_))
+    # Calculation for alpha channel -> outA = SrcA + DstA(1 - SrcA)
+    new[..., 3:] = numpy.add(alpha1_, alpha2_ * (1 - alpha1_))
+    # -------------------  pre-multiplied -------------------
+
+    # De-normalization
+    numpy.multiply(new, 255, out=new)
+
+    # Capping all the values over 255
+    numpy.minimum(new, 255, out=new)
+
+    # Cast to uint8 straight into the destination
+    rgb_out_[...] = new[..., :3]
+    alpha_out_[...] = new[..., 3]
+
+
+def premultiplied_over_int(rgb1_: numpy.ndarray, alpha1_: numpy.ndarray,
+                           rgb2_: numpy.ndarray, alpha2_: numpy.ndarray,
+                           rgb_out_: numpy.ndarray, alpha_out_: numpy.ndarray) -> None:
+    """
+    Pre-multiplied "over" of 8-bit pre-multiplied values, no normalization and no division by outA.
+
+    :param rgb1_: uint8 array (h, w, 3), first layer RGB values pre-multiplied by alpha1_
+    :param alpha1_: uint8 array (h, w, 1), alpha values for layer 1
+    :param rgb2_: uint8 array (h, w, 3), second layer RGB values pre-multiplied by alpha2_
+    :param alpha2_: uint8 array (h, w, 1), alpha values for layer 2
+    :param rgb_out_: uint8 array (h, w, 3), RGB destination
+    :param alpha_out_: uint8 array (h, w), alpha destination
+    :return: None
+    """
+    inv_alpha1 = numpy.subtract(255, alpha1_, dtype=numpy.uint16)
+
+    # outRGB = SrcRGB + DstRGB(1 - SrcA)
+    rgb = div255(numpy.multiply(rgb2_, inv_alpha1, dtype=numpy.uint16))
+    rgb += rgb1_
+    rgb_out_[...] = numpy.minimum(rgb, 255, out=rgb)
+
+    # outA = SrcA + DstA(1 - SrcA)
+    alpha = div255(numpy.multiply(alpha2_, inv_alpha1, dtype=numpy.uint16))
+    alpha += alpha1_
+    alpha_out_[..., numpy.newaxis] = numpy.minimum(alpha, 255, out=alpha)
+
+
+def alpha_blend(texture1_, texture2_, integer_: bool = False, out_=None, kernel_: str = None, cache_=None,
+                workspace_=None):
+    """
+    Straight alpha "over" of texture1 (foreground) on texture2 (background), see alpha_blending.
+
+    The alpha index of the textures (see alpha_tiles) selects a cheaper path when possible:
+    opaque foreground (copy of texture1), transparent foreground (copy of texture2, RGB values
+    looked up in transparent_table) and opaque background (no division by outA, numpy, integer and
+    workspace kernels only). The same choice is made per run of tiles, only the tiles with partial
+    foreground alpha are blended.
+    The tiles skipped hold the values the kernel would have written.
+
+    :param texture1_: First layer (foreground), uint8 array (h, w, 4) RGBA or 32-bit Surface
+    :param texture2_: Second layer (background), uint8 array (h, w, 4) RGBA or 32-bit Surface
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    (result within +/-1 of the float path)
+    :param out_: Optional destination, uint8 array (h, w, 4) or 32-bit Surface with per-pixel alpha
+    :param kernel_: Kernel, 'numpy', 'fused' or 'lut' (default KERNEL, see set_kernel)
+    :param cache_: Optional TextureCache, the alpha index is built once per texture
+    :param workspace_: Optional BlendWorkspace, float kernels computed in its scratch buffers instead of
+    the numpy kernels (same result in float64, the default, within +/-1 in float32)
+    :return: Return a new uint8 array (h, w, 4) RGBA or out_
+    """
+    w, h = texture_size(texture1_)
+    assert texture_size(texture2_) == (w, h), \
+        'Expecting textures with the same size got %s and %s ' % ((w, h), texture_size(texture2_))
+
+    with stage('alpha_blend.planes'):
+        out = numpy.empty((h, w, 4), dtype=numpy.uint8) if out_ is None else out_
+        rgb_out, alpha_out = output_views(out, w, h)
+        rgb1, alpha1 = planes(texture1_)
+        rgb2, alpha2 = planes(texture2_)
+
+    with stage('alpha_blend.index'):
+        opaque_background = alpha_range(texture2_, cache_)[0] == 255
+        kinds = tile_kinds(alpha_tiles(texture1_, TILE, cache_))
+        # Whole texture as a single region when it is uniform or has no tile to skip
+        runs = [(kinds.flat[0], (slice(None), slice(None)))] if (kinds == kinds.flat[0]).all() \
+            else tile_runs(kinds, TILE, w, h)
+
+    name = kernel_ or KERNEL
+    # The opaque background kernels (no division by outA) replace the numpy, integer and workspace
+    # kernels only, the kernel requested ('lut' or 'fused') is always used
+    opaque = opaque_background and name != 'lut' and (integer_ or workspace_ is not None or name == 'numpy')
+    if name == 'lut':
+        kernel = alpha_blending_lut
+    elif integer_:
+        kernel = alpha_blending_opaque_int if opaque else alpha_blending_int
+    elif workspace_ is not None:
+        kernel = workspace_.alpha_blending_opaque if opaque else workspace_.alpha_blending
+    elif name == 'fused':
+        kernel = alpha_blending_fused
+    else:
+        kernel = alpha_blending_opaque_float if opaque else alpha_blending_float
+
+    table = None
+    with stage('alpha_blend.blend'):
+        for kind, region in runs:
+            if kind == OPAQUE:
+                # Opaque foreground, outRGB = SrcRGB and outA = 1
+                rgb_out[region] = rgb1[region]
+                alpha_out[region] = 255
+            elif kind == TRANSPARENT and opaque_background:
+                # Transparent foreground, the background is unchanged
+                rgb_out[region] = rgb2[region]
+                alpha_out[region] = 255
+            elif kind == TRANSPARENT:
+                # Transparent foreground, outA = DstA and outRGB = DstRGB rounded as the kernel does
+                if table is None:
+                    table = transparent_table(kernel, None if workspace_ is None else workspace_.dtype)
+                # index DstA x 256 + DstRGB gathered from the flat table
+                index = numpy.left_shift(alpha2[region], 8, dtype=numpy.uint16)[:, :, numpy.newaxis]
+                rgb_out[region] = numpy.take(table, numpy.bitwise_or(index, rgb2[region]))
+                alpha_out[region] = alpha2[region]
+            elif opaque:
+                kernel(rgb1[region], alpha1[region], rgb2[region], rgb_out[region], alpha_out[region])
+            else:
+                kernel(rgb1[region], alpha1[region], rgb2[region], alpha2[region],
+                       rgb_out[region], alpha_out[region])
+    return out
+
+
+def blend_add(texture1_, texture2_, set_alpha1_: (float, numpy.ndarray), set_alpha2_: (float, numpy.ndarray),
+              mask_: bool = False, integer_: bool = False, out_=None, cache_=None, workspace_=None):
+    """
+    Pre-multiplied "over" of texture1 on texture2 with extra alpha values, see blend_texture_add.
+
+    With mask_ the alpha index of texture1 (see alpha_tiles) skips the tiles fully masked
+    (written as 0 without blending) and the mask is only applied to the tiles holding transparent pixels.
+
+    :param texture1_: First layer, uint8 array (h, w, 4) RGBA or 32-bit Surface
+    :param texture2_: Second layer, uint8 array (h, w, 4) RGBA or 32-bit Surface
+    :param set_alpha1_: Alpha values for texture1 (can be a float or a numpy array (h, w, 1), a uint8 array
+    is in range [0 ... 255], see alpha_to_int and alpha_to_float)
+    :param set_alpha2_: Alpha values for texture2 (can be a float or a numpy array (h, w, 1))
+    :param mask_: True | False, create a mask from texture1 (only black pixels)
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    (result within +/-1 of the float path)
+    :param out_: Optional destination, uint8 array (h, w, 4) or 32-bit Surface with per-pixel alpha
+    :param cache_: Optional TextureCache, re-use the planes, mask and alpha index extracted from the
+    textures (and the pre-multiplied planes for a given alpha) by previous calls
+    :param workspace_: Optional BlendWorkspace, float path computed in its scratch buffers (same result in
+    float64, the default, within +/-1 in float32)
+    :return: Return a new uint8 array (h, w, 4) RGBA or out_
+    """
+    assert isinstance(set_alpha1_, (float, numpy.ndarray)), \
+        'Expecting float or numpy.ndarray for argument set_alpha1_ got %s ' % type(set_alpha1_)
+    assert isinstance(set_alpha2_, (float, numpy.ndarray)), \
+        'Expecting float for argument set_alpha2_ got %s ' % type(set_alpha2_)
+
+    w, h = texture_size(texture1_)
+    with stage('blend_add.planes'):
+        texture_rgb1, alpha1_ = planes(texture1_)
+        rgb1 = texture_rgb1
+        rgb2, _ = planes(texture2_)
+
+        out = numpy.empty((h, w, 4), dtype=numpy.uint8) if out_ is None else out_
+        rgb_out, alpha_out = output_views(out, w, h)
+
+        if integer_:
+            # -------------------  fixed point uint16 -------------------
+            # Scalar alphas stay python int and are broadcast by numpy (no full size array).
+            if cache_ is not None:
+                rgb1, rgb2 = cache_.rgb(texture1_), cache_.rgb(texture2_)
+            alpha1, alpha2 = alpha_to_int(set_alpha1_), alpha_to_int(set_alpha2_)
+        else:
+            # Scalar alphas stay python float and are broadcast by numpy (no full size array)
+            alpha1, alpha2 = alpha_to_float(set_alpha1_), alpha_to_float(set_alpha2_)
+            if cache_ is not None:
+                # Normalized and pre-multiplied RGB values
+                rgb1 = cache_.premultiplied(texture1_, set_alpha1_)
+                rgb2 = cache_.premultiplied(texture2_, set_alpha2_)
+
+    def blend(region_):
+        region1 = alpha1[region_] if isinstance(alpha1, numpy.ndarray) else alpha1
+        region2 = alpha2[region_] if isinstance(alpha2, numpy.ndarray) else alpha2
+        if isinstance(set_alpha1_, float) and set_alpha1_ == 1.0:
+            # Opaque layer 1, outRGB = SrcRGB and outA = 1 (layer 2 hidden)
+            rgb_out[region_] = texture_rgb1[region_]
+            alpha_out[region_] = 255
+        elif integer_:
+            blend_texture_add_int(rgb1[region_], region1, rgb2[region_], region2,
+                                  rgb_out[region_], alpha_out[region_])
+        elif cache_ is not None:
+            kernel = blend_texture_add_float if workspace_ is None else workspace_.blend_texture_add
+            kernel(rgb1[region_], region1, rgb2[region_], region2, rgb_out[region_], alpha_out[region_])
+        elif workspace_ is not None:
+            workspace_.blend_texture_add(workspace_.premultiply('rgb1', rgb1[region_], region1), region1,
+                                         workspace_.premultiply('rgb2', rgb2[region_], region2), region2,
+                                         rgb_out[region_], alpha_out[region_])
+        else:
+            # Normalize and pre-multiply the RGB values
+            blend_texture_add_float((rgb1[region_] / 255) * region1, region1, (rgb2[region_] / 255) * region2,
+                                    region2, rgb_out[region_], alpha_out[region_])
+
+    full = (slice(None), slice(None))
+    if not mask_:
+        with stage('blend_add.blend'):
+            blend(full)
+        return out
+
+    with stage('blend_add.index'):
+        # Mask (array with black pixels flagged) alpha1_ <= 0, the tiles without transparent pixel
+        # are labelled OPAQUE (mask empty)
+        low, high = alpha_tiles(texture1_, TILE, cache_)
+        kinds = numpy.where(high == 0, TRANSPARENT, numpy.where(low > 0, OPAQUE, MIXED))
+        runs = [(kinds.flat[0], full)] if (kinds == kinds.flat[0]).all() else tile_runs(kinds, TILE, w, h)
+
+    with stage('blend_add.blend'):
+        for kind, region in runs:
+            if kind == TRANSPARENT:
+                rgb_out[region] = 0
+                alpha_out[region] = 0
+            elif kind == OPAQUE:
+                blend(region)
+            else:
+                # Mask extracted before the blend (out_ can be texture1)
+                mask_alpha1 = cache_.mask(texture1_)[region] if cache_ is not None else alpha1_[region] == 0
+                blend(region)
+                # Apply the mask_ to the new texture
+                rgb_out[region][mask_alpha1] = 0
+                alpha_out[region][mask_alpha1] = 0
+    return out
@@ -0,0 +1,128 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Incremental (dirty rectangles) alpha compositing
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import pygame
+import numpy
+
+from Compositing import alpha_blend, alpha_blending_float, alpha_blending_int, planes, to_surface
+
+
+class DirtyRectCompositor:
+    """
+    Keep the last composite of surface1 over surface2 (alpha_blending) and re-blend only
+    the regions that changed.
+
+    The regions are either given by the caller (rects drawn into the layers) or found by
+    comparing the layers with a snapshot taken at the previous update, on a grid of tiles.
+    The updated rectangles are returned, ready for pygame.display.update(rects).
+    """
+
+    def __init__(self, surface1_: pygame.Surface, surface2_: pygame.Surface,
+                 integer_: bool = False, tile_: int = 32):
+        """
+        :param surface1_: First layer texture (foreground), 32-bit with per-pixel alpha
+        :param surface2_: Second layer texture (background), 32-bit with per-pixel alpha
+        :param integer_: True | False, use the uint16 fixed point path instead of float64
+        :param tile_: Tile size (pixels) of the grid used to locate the changes
+        """
+        assert isinstance(surface1_, pygame.Surface), \
+            'Expecting Surface for argument surface got %s ' % type(surface1_)
+        assert isinstance(surface2_, pygame.Surface), \
+            'Expecting Surface for argument surface2_ got %s ' % type(surface2_)
+        assert surface1_.get_size() == surface2_.get_size(), \
+            'Expecting surfaces with the same size got %s and %s ' % (surface1_.get_size(), surface2_.get_size())
+        assert isinstance(tile_, int) and tile_ > 0, \
+            'Expecting positive int for argument tile_ got %s ' % tile_
+
+        self.surface1 = surface1_
+        self.surface2 = surface2_
+        self.integer = integer_
+        self.tile = tile_
+        self.size = w, h = surface1_.get_size()
+
+        # Last composite, the Surface shares the array memory
+        self.array = numpy.empty((h, w, 4), dtype=numpy.uint8)
+        self.texture = to_surface(self.array)
+        alpha_blend(surface1_, surface2_, integer_, out_=self.array)
+
+        # Layers as they were at the last update (used to find the changes)
+        self.snapshot = [numpy.array(view) for view in planes(surface1_) + planes(surface2_)]
+
+    def diff(self) -> list:
+        """
+        Compare the layers with the last snapshot.
+
+        :return: Return a list of pygame.Rect (one per run of changed tiles on a row of tiles)
+        """
+        w, h = self.size
+        changed = numpy.zeros((h, w), dtype=bool)
+        for view, snapshot in zip(planes(self.surface1) + planes(self.surface2), self.snapshot):
+            difference = view != snapshot
+            changed |= difference.any(axis=2) if difference.ndim == 3 else difference
+
+        # Reduce the changes to the grid of tiles
+        rows = numpy.arange(0, h, self.tile)
+        columns = numpy.arange(0, w, self.tile)
+        grid = numpy.logical_or.reduceat(numpy.logical_or.reduceat(changed, rows, axis=0), columns, axis=1)
+
+        rects = []
+        for j, row in enumerate(grid):
+            # Runs of changed tiles on this row, start (+1) and end (-1) marked by the derivative
+            edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], row.astype(numpy.int8), [0]))))
+            for start, end in zip(edges[::2], edges[1::2]):
+                rects.append(pygame.Rect(start * self.tile, j * self.tile,
+                                         (end - start) * self.tile, self.tile).clip((0, 0, w, h)))
+        return rects
+
+    def update(self, rects_: list = None) -> list:
+        """
+        Re-blend the dirty regions of the composite.
+
+        :param rects_: list of pygame.Rect (or rect-style tuples) modified in surface1 or surface2,
+        None to find them by comparing the layers with the last snapshot
+        :return: Return the list of updated pygame.Rect (clipped to the composite)
+        """
+        w, h = self.size
+        if rects_ is None:
+            rects = self.diff()
+        else:
+            rects = [pygame.Rect(rect).clip((0, 0, w, h)) for rect in rects_]
+            rects = [rect for rect in rects if rect.w > 0 and rect.h > 0]
+
+        # Regions blended straight from the layer views (no subsurface)
+        views = planes(self.surface1) + planes(self.surface2)
+        kernel = alpha_blending_int if self.integer else alpha_blending_float
+        for rect in rects:
+            region = slice(rect.top, rect.bottom), slice(rect.left, rect.right)
+            rgb1, alpha1, rgb2, alpha2 = (view[region] for view in views)
+            kernel(rgb1, alpha1, rgb2, alpha2, self.array[region][:, :, :3], self.array[region][:, :, 3])
+            for view, snapshot in zip(views, self.snapshot):
+                snapshot[region] = view[region]
+        return rects
@@ -0,0 +1,215 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Mask registry, alpha masks (e.g. Assets/radial1_inverted.png) served at any size from a mipmap pyramid
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+from collections import OrderedDict
+
+import numpy
+
+from Compositing import planes, rgba32
+
+
+def load_alpha(mask_) -> numpy.ndarray:
+    """
+    Normalized alpha channel of a mask.
+
+    :param mask_: Image path, 32-bit pygame Surface with per-pixel alpha, uint8 RGBA array (h, w, 4),
+    uint8 alpha array (h, w) or float alpha array (h, w) | (h, w, 1) in range [0.0 ... 1.0]
+    :return: Return a float array (h, w) in range [0.0 ... 1.0]
+    """
+    if isinstance(mask_, str):
+        # pygame only needed to decode an image file
+        import pygame
+        mask_ = rgba32(pygame.image.load(mask_))
+
+    if isinstance(mask_, numpy.ndarray) and mask_.ndim == 3 and mask_.shape[2] == 1:
+        mask_ = mask_[:, :, 0]
+    if isinstance(mask_, numpy.ndarray) and mask_.ndim == 2:
+        return mask_ / 255 if mask_.dtype == numpy.uint8 else mask_.astype(float)
+    return planes(mask_)[1] / 255
+
+
+def downsample(alpha_: numpy.ndarray) -> numpy.ndarray:
+    """
+    Halve an alpha array (2 x 2 box filter, odd sizes extend the last row / column).
+
+    :param alpha_: float array (h, w)
+    :return: Return a float array (ceil(h / 2), ceil(w / 2))
+    """
+    h, w = alpha_.shape
+    if h % 2 or w % 2:
+        alpha_ = numpy.pad(alpha_, ((0, h % 2), (0, w % 2)), mode='edge')
+    return (alpha_[0::2, 0::2] + alpha_[1::2, 0::2] + alpha_[0::2, 1::2] + alpha_[1::2, 1::2]) * 0.25
+
+
+def resample(alpha_: numpy.ndarray, size_: tuple) -> numpy.ndarray:
+    """
+    Bilinear resampling (pixel centers aligned), cheap when the size is within a factor 2.
+
+    :param alpha_: float array (h, w)
+    :param size_: Size (w, h) of the result
+    :return: Return a float array (h, w)
+    """
+    w, h = size_
+
+    def axis(n_, source_):
+        # Source coordinates of the destination pixel centers, 2 neighbours and weights
+        position = numpy.clip((numpy.arange(n_) + 0.5) * source_ / n_ - 0.5, 0, source_ - 1)
+        low = position.astype(int)
+        return low, numpy.minimum(low + 1, source_ - 1), position - low
+
+    top, bottom, fy = axis(h, alpha_.shape[0])
+    left, right, fx = axis(w, alpha_.shape[1])
+    rows = alpha_[top] * (1 - fy)[:, numpy.newaxis] + alpha_[bottom] * fy[:, numpy.newaxis]
+    return rows[:, left] * (1 - fx) + rows[:, right] * fx
+
+
+class MaskPyramid:
+    """
+    Mipmap pyramid of a mask, level k is the mask halved k times (down to 1 pixel).
+    """
+
+    def __init__(self, mask_):
+        """
+        :param mask_: Mask (see load_alpha)
+        """
+        level = load_alpha(mask_)
+        self.levels = [level]
+        while level.shape != (1, 1):
+            level = downsample(level)
+            self.levels.append(level)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+    def alpha(self, size_: tuple) -> numpy.ndarray:
+        """
+        Mask at a given size, resampled from the smallest level at least as large.
+
+        :param size_: Size (w, h)
+        :return: Return a new float array (h, w, 1) in range [0.0 ... 1.0] (set_alpha1_ of blend_texture_add)
+        """
+        w, h = size_
+        assert w > 0 and h > 0, \
+            'Expecting positive size for argument size_ got %s ' % (size_,)
+        level = self.levels[0]
+        for candidate in self.levels[1:]:
+            if candidate.shape[0] < h or candidate.shape[1] < w:
+                break
+            level = candidate
+        alpha = level.copy() if level.shape == (h, w) else resample(level, (w, h))
+        return alpha[:, :, numpy.newaxis]
+
+
+class MaskRegistry:
+    """
+    Masks registered by name, served at the requested size.
+
+    The pyramid of a mask is built on first use, the masks served are memoised (LRU) within
+    a memory budget and returned read only: the same array is returned for the same name and size
+    (TextureCache pre-multiplied planes are keyed on it).
+    """
+
+    def __init__(self, max_bytes_: int = 32 * 1024 * 1024):
+        """
+        :param max_bytes_: Memory budget (bytes) of the memoised masks, least recently used are evicted above it
+        """
+        assert isinstance(max_bytes_, int) and max_bytes_ > 0, \
+            'Expecting positive int for argument max_bytes_ got %s ' % max_bytes_
+        self.max_bytes = max_bytes_
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._sources = {}
+        self._pyramids = {}
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def register(self, name_: str, mask_) -> None:
+        """
+        Register (or replace) a mask, nothing is loaded before the first get.
+
+        :param name_: Mask name
+        :param mask_: Mask (see load_alpha), e.g. 'Assets\\radial1_inverted.png'
+        :return: None
+        """
+        self.forget(name_)
+        self._sources[name_] = mask_
+
+    def forget(self, name_: str) -> None:
+        """
+        Release the pyramid and the memoised masks of a name (the registration is kept).
+
+        :param name_: Mask name
+        :return: None
+        """
+        self._pyramids.pop(name_, None)
+        for key in [key for key in self._entries if key[0] == name_]:
+            self.nbytes -= self._entries.pop(key).nbytes
+
+    def pyramid(self, name_: str) -> MaskPyramid:
+        """
+        :param name_: Mask name
+        :return: Return the pyramid of the mask (built on first use)
+        """
+        assert name_ in self._sources, 'Unknown mask %s ' % name_
+        pyramid = self._pyramids.get(name_)
+        if pyramid is None:
+            pyramid = self._pyramids[name_] = MaskPyramid(self._sources[name_])
+        return pyramid
+
+    def get(self, name_: str, size_: tuple, uint8_: bool = False) -> numpy.ndarray:
+        """
+        :param name_: Mask name
+        :param size_: Size (w, h) of the surfaces the mask applies to
+        :param uint8_: True | False, 8-bit mask in range [0 ... 255] (integer_ blends use it without conversion,
+        the float paths divide it by 255, see Compositing.alpha_to_float)
+        :return: Return a read only float array (h, w, 1) in range [0.0 ... 1.0] (uint8 array with uint8_)
+        """
+        key = (name_, tuple(size_), uint8_)
+        alpha = self._entries.get(key)
+        if alpha is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return alpha
+
+        self.misses += 1
+        alpha = self.pyramid(name_).alpha(size_)
+        if uint8_:
+            alpha = (alpha * 255 + 0.5).astype(numpy.uint8)
+        alpha.flags.writeable = False
+        self._entries[key] = alpha
+        self.nbytes += alpha.nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return alpha
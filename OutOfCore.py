@@ -0,0 +1,186 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Out-of-core compositing of very large images, raw RGBA files memory-mapped and blended tile by tile
+
+python OutOfCore.py foreground.png background.png output.raw
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import os
+import sys
+import time
+
+import numpy
+
+from Compositing import alpha_blend, blend_add, planes, rgba32
+
+# Default tile size (width, height), float64 temporaries of a tile stay around 16 MB
+TILE = (2048, 256)
+
+
+def open_rgba(path_: str, size_: tuple, mode_: str = 'r') -> numpy.memmap:
+    """
+    Memory-map a raw RGBA file (8 bits per channel, rows of pixels, no header).
+
+    :param path_: Raw file path
+    :param size_: Image size (w, h)
+    :param mode_: 'r' read only, 'r+' read / write, 'w+' create (or overwrite) the file
+    :return: Return a uint8 memmap (h, w, 4)
+    """
+    assert mode_ in ('r', 'r+', 'w+'), \
+        'Expecting r, r+ or w+ for argument mode_ got %s ' % mode_
+    w, h = size_
+    return numpy.memmap(path_, dtype=numpy.uint8, mode=mode_, shape=(h, w, 4))
+
+
+def decode_to_raw(image_path_: str, raw_path_: str, rows_: int = 256) -> tuple:
+    """
+    Decode an image once into a raw RGBA file (see open_rgba).
+
+    The decoded image is held by pygame during the conversion, the raw file is written
+    rows_ rows at a time from views of the surface (no full size copy).
+
+    :param image_path_: Image path (any format supported by pygame.image.load)
+    :param raw_path_: Raw RGBA file created
+    :param rows_: Number of rows converted at a time
+    :return: Return the image size (w, h)
+    """
+    # pygame only needed to decode the image
+    import pygame
+    surface = rgba32(pygame.image.load(image_path_))
+    size = w, h = surface.get_size()
+
+    raw = open_rgba(raw_path_, size, 'w+')
+    rgb, alpha = planes(surface)
+    for y in range(0, h, rows_):
+        rows = slice(y, min(y + rows_, h))
+        raw[rows, :, :3] = rgb[rows]
+        raw[rows, :, 3] = alpha[rows]
+    raw.flush()
+    del rgb, alpha, raw
+    return size
+
+
+def composite_tiles(texture1_: numpy.ndarray, texture2_: numpy.ndarray, out_: numpy.ndarray,
+                    mode_: str = 'alpha_blending', set_alpha1_: (float, numpy.ndarray) = 1.0,
+                    set_alpha2_: (float, numpy.ndarray) = 1.0, mask_: bool = False,
+                    integer_: bool = False, tile_: tuple = TILE) -> numpy.ndarray:
+    """
+    Composite texture1 over texture2 into out_ one tile at a time.
+
+    The arrays are usually memmaps (see open_rgba): each tile is read, blended with the
+    same kernels as alpha_blending / blend_texture_add (identical result) and written,
+    the memory used does not depend on the image size.
+
+    :param texture1_: uint8 array (h, w, 4) RGBA, first layer (foreground)
+    :param texture2_: uint8 array (h, w, 4) RGBA, second layer (background)
+    :param out_: uint8 array (h, w, 4) receiving the composite (can be texture2_ for an in place blend)
+    :param mode_: 'alpha_blending' (straight alpha over) or 'blend_texture_add' (pre-multiplied)
+    :param set_alpha1_: blend_texture_add only, alpha values for texture1 (float or array (h, w, 1))
+    :param set_alpha2_: blend_texture_add only, alpha values for texture2 (float or array (h, w, 1))
+    :param mask_: blend_texture_add only, True | False, create a mask from texture1 (only black pixels)
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    :param tile_: Tile size (width, height) in pixels
+    :return: Return out_
+    """
+    assert mode_ in ('alpha_blending', 'blend_texture_add'), \
+        'Expecting alpha_blending or blend_texture_add for argument mode_ got %s ' % mode_
+    assert texture1_.shape == texture2_.shape == out_.shape, \
+        'Expecting arrays with the same shape got %s, %s and %s ' % (texture1_.shape, texture2_.shape, out_.shape)
+    assert len(tile_) == 2 and tile_[0] > 0 and tile_[1] > 0, \
+        'Expecting tuple (width, height) for argument tile_ got %s ' % (tile_,)
+
+    h, w = texture1_.shape[:2]
+    tile_w, tile_h = tile_
+    for y in range(0, h, tile_h):
+        for x in range(0, w, tile_w):
+            region = slice(y, min(y + tile_h, h)), slice(x, min(x + tile_w, w))
+            if mode_ == 'alpha_blending':
+                alpha_blend(texture1_[region], texture2_[region], integer_, out_=out_[region])
+            else:
+                alpha1 = set_alpha1_[region] if isinstance(set_alpha1_, numpy.ndarray) else set_alpha1_
+                alpha2 = set_alpha2_[region] if isinstance(set_alpha2_, numpy.ndarray) else set_alpha2_
+                blend_add(texture1_[region], texture2_[region], alpha1, alpha2, mask_, integer_,
+                          out_=out_[region])
+        # Finished rows are written back, their pages can be reclaimed
+        if isinstance(out_, numpy.memmap):
+            out_.flush()
+    return out_
+
+
+def composite_files(path1_: str, path2_: str, output_: str, size_: tuple, mode_: str = 'alpha_blending',
+                    set_alpha1_: (float, numpy.ndarray) = 1.0, set_alpha2_: (float, numpy.ndarray) = 1.0,
+                    mask_: bool = False, integer_: bool = False, tile_: tuple = TILE) -> dict:
+    """
+    Composite two raw RGBA files into a raw RGBA file (see open_rgba and composite_tiles).
+
+    :param path1_: Raw RGBA file, first layer (foreground)
+    :param path2_: Raw RGBA file, second layer (background)
+    :param output_: Raw RGBA file created, output_ = path2_ blends in place
+    :param size_: Image size (w, h)
+    :param mode_: 'alpha_blending' or 'blend_texture_add', see composite_tiles
+    :param set_alpha1_: blend_texture_add only, alpha values for the first layer
+    :param set_alpha2_: blend_texture_add only, alpha values for the second layer
+    :param mask_: blend_texture_add only, True | False, create a mask from the first layer
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    :param tile_: Tile size (width, height) in pixels
+    :return: Return a dict with the elapsed time (seconds) and megapixels per second
+    """
+    start = time.perf_counter()
+    texture1 = open_rgba(path1_, size_)
+    if os.path.abspath(output_) == os.path.abspath(path2_):
+        texture2 = out = open_rgba(path2_, size_, 'r+')
+    else:
+        texture2 = open_rgba(path2_, size_)
+        out = open_rgba(output_, size_, 'w+')
+    composite_tiles(texture1, texture2, out, mode_, set_alpha1_, set_alpha2_, mask_, integer_, tile_)
+    del texture1, texture2, out
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'mpix_per_s': size_[0] * size_[1] / seconds / 1e6 if seconds > 0 else 0.0}
+
+
+if __name__ == '__main__':
+    # Usage: python OutOfCore.py <foreground image> <background image> <output raw file>
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+    if len(sys.argv) < 4:
+        print('Usage: python OutOfCore.py foreground.png background.png output.raw')
+        sys.exit(1)
+
+    # Images decoded once into raw RGBA scratch files next to the output, removed afterwards
+    scratch = (sys.argv[3] + '.1.raw', sys.argv[3] + '.2.raw')
+    try:
+        size1 = decode_to_raw(sys.argv[1], scratch[0])
+        size2 = decode_to_raw(sys.argv[2], scratch[1])
+        assert size1 == size2, 'Expecting images with the same size got %s and %s ' % (size1, size2)
+        stats = composite_files(scratch[0], scratch[1], sys.argv[3], size1)
+    finally:
+        for path in scratch:
+            if os.path.exists(path):
+                os.remove(path)
+    print('%sx%s RGBA written to %s in %.3f s (%.1f Mpix/s)' % (size1 + (sys.argv[3], stats['seconds'],
+                                                                    stats['mpix_per_s'])))
@@ -0,0 +1,252 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Streaming compositing of frame sequences (source -> decode -> blend -> encode -> sink)
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import os
+import sys
+import time
+import glob
+import queue
+import threading
+
+import pygame
+import numpy
+
+from Compositing import alpha_blend, blend_add, rgba32
+
+
+class _End:
+    """
+    End of stream marker, carries the exception raised by the producer (if any).
+    """
+
+    def __init__(self, error_: BaseException = None):
+        self.error = error_
+
+
+def mask_alpha(mask_: pygame.Surface, size_: tuple) -> numpy.ndarray:
+    """
+    Create an alpha array from the alpha channel of a mask image (e.g. Assets/radial1_inverted.png).
+
+    :param mask_: 32-bit pygame Surface with per-pixel alpha
+    :param size_: Size (w, h) of the surfaces to blend
+    :return: Return a float array (h, w, 1) in range [0.0 ... 1.0] (set_alpha1_ of blend_texture_add)
+    """
+    mask_ = rgba32(mask_)
+    if mask_.get_size() != tuple(size_):
+        mask_ = pygame.transform.smoothscale(mask_, size_)
+    return (pygame.surfarray.array_alpha(mask_).transpose(1, 0) / 255)[:, :, numpy.newaxis]
+
+
+def prefetch(iterable_, depth_: int = 4):
+    """
+    Consume an iterable in a background thread, at most depth_ items ahead of the caller.
+
+    :param iterable_: Iterable (e.g. a generator stage)
+    :param depth_: Size of the bounded queue between the thread and the caller
+    :return: Yield the items of iterable_ (exceptions raised by the producer are re-raised)
+    """
+    items = queue.Queue(maxsize=depth_)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable_:
+                if stop.is_set():
+                    return
+                items.put(item)
+        except BaseException as error:
+            items.put(_End(error))
+            return
+        items.put(_End())
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if isinstance(item, _End):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+    finally:
+        # Consumer done (or closed early), unblock the producer
+        stop.set()
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+
+def load_frames(paths_, size_: tuple = None):
+    """
+    Decode the images (source -> decode stage).
+
+    :param paths_: Iterable of image paths
+    :param size_: Optional size (w, h), frames of a different size are scaled (smoothscale)
+    :return: Yield tuples (path, 32-bit RGBA Surface)
+    """
+    for path in paths_:
+        surface = rgba32(pygame.image.load(path))
+        if size_ is not None and surface.get_size() != tuple(size_):
+            surface = pygame.transform.smoothscale(surface, size_)
+        yield path, surface
+
+
+def blend_frames(frames_, background_: pygame.Surface, mode_: str = 'alpha_blending',
+                 set_alpha1_: (float, numpy.ndarray) = 1.0, set_alpha2_: (float, numpy.ndarray) = 1.0,
+                 mask_: bool = False, integer_: bool = False, buffers_: int = 6):
+    """
+    Blend every frame over the background (blend stage).
+
+    The results are written into a ring of buffers_ pre-allocated surfaces, a yielded surface
+    is re-used buffers_ frames later: the consumer must be done with it by then
+    (save_frames with depth_ <= buffers_ - 2).
+
+    :param frames_: Iterable of tuples (path, Surface), foreground frames
+    :param background_: 32-bit Surface with per-pixel alpha, same size as the frames
+    :param mode_: 'alpha_blending' (straight alpha over) or 'blend_texture_add' (pre-multiplied)
+    :param set_alpha1_: blend_texture_add only, alpha values for the frames (float or array, e.g. mask_alpha)
+    :param set_alpha2_: blend_texture_add only, alpha values for the background (float or array)
+    :param mask_: blend_texture_add only, True | False, create a mask from the frames (only black pixels)
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    :param buffers_: Number of output surfaces in the ring
+    :return: Yield tuples (path, blended Surface)
+    """
+    assert mode_ in ('alpha_blending', 'blend_texture_add'), \
+        'Expecting alpha_blending or blend_texture_add for argument mode_ got %s ' % mode_
+    ring = [pygame.Surface(background_.get_size(), pygame.SRCALPHA, 32) for _ in range(buffers_)]
+    for index, (path, surface) in enumerate(frames_):
+        out = ring[index % buffers_]
+        if mode_ == 'alpha_blending':
+            alpha_blend(surface, background_, integer_, out_=out)
+        else:
+            blend_add(surface, background_, set_alpha1_, set_alpha2_, mask_, integer_, out_=out)
+        yield path, out
+
+
+def save_frames(frames_, output_, depth_: int = 4) -> int:
+    """
+    Encode the frames on a background thread (encode -> sink stage).
+
+    :param frames_: Iterable of tuples (path, Surface)
+    :param output_: Format string for the output paths, fields {index} and {name} (source file
+    name without extension), e.g. 'Blend_{index:05d}.png', or a callable (path, index) -> output path
+    :param depth_: Size of the bounded queue feeding the encoder thread
+    :return: Return the number of frames saved
+    """
+    if isinstance(output_, str):
+        pattern = output_
+
+        def output_(path_, index_):
+            return pattern.format(index=index_, name=os.path.splitext(os.path.basename(path_))[0])
+
+    jobs = queue.Queue(maxsize=depth_)
+    errors = []
+
+    def encode():
+        while True:
+            job = jobs.get()
+            if isinstance(job, _End):
+                return
+            # Keep draining after an error so the producer never blocks
+            if not errors:
+                try:
+                    pygame.image.save(job[1], job[0])
+                except BaseException as error:
+                    errors.append(error)
+
+    thread = threading.Thread(target=encode, daemon=True)
+    thread.start()
+    count = 0
+    try:
+        for path, surface in frames_:
+            if errors:
+                break
+            jobs.put((output_(path, count), surface))
+            count += 1
+    finally:
+        jobs.put(_End())
+        thread.join()
+    if errors:
+        raise errors[0]
+    return count
+
+
+def composite_sequence(paths_, background_: pygame.Surface, output_, mode_: str = 'alpha_blending',
+                       set_alpha1_: (float, numpy.ndarray) = 1.0, set_alpha2_: (float, numpy.ndarray) = 1.0,
+                       mask_: bool = False, integer_: bool = False, depth_: int = 4) -> dict:
+    """
+    Composite a sequence of images over a background and save the results.
+
+    Decoding (prefetch thread), blending (caller thread) and encoding (encoder thread) overlap,
+    the queues are bounded by depth_ so the memory does not depend on the sequence length.
+
+    :param paths_: Iterable of foreground image paths (can be a generator)
+    :param background_: Background Surface (converted to 32-bit RGBA), frames are scaled to its size
+    :param output_: Output paths, see save_frames
+    :param mode_: 'alpha_blending' or 'blend_texture_add', see blend_frames
+    :param set_alpha1_: blend_texture_add only, alpha values for the frames (float or array, e.g. mask_alpha)
+    :param set_alpha2_: blend_texture_add only, alpha values for the background (float or array)
+    :param mask_: blend_texture_add only, True | False, create a mask from the frames (only black pixels)
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    :param depth_: Size of the prefetch and encode queues
+    :return: Return a dict with the number of frames, the elapsed time (seconds) and frames per second
+    """
+    background_ = rgba32(background_)
+    start = time.perf_counter()
+    frames = prefetch(load_frames(paths_, background_.get_size()), depth_)
+    blended = blend_frames(frames, background_, mode_, set_alpha1_, set_alpha2_, mask_, integer_,
+                           buffers_=depth_ + 2)
+    count = save_frames(blended, output_, depth_)
+    seconds = time.perf_counter() - start
+    return {'frames': count, 'seconds': seconds, 'fps': count / seconds if seconds > 0 else 0.0}
+
+
+if __name__ == '__main__':
+    # Usage: python Pipeline.py <foreground glob> <background image> <output pattern> [mask image]
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+
+    if len(sys.argv) < 4:
+        print('Usage: python Pipeline.py "frames/*.png" Assets/background1.png "Blend_{index:05d}.png" '
+              '[Assets/radial1_inverted.png]')
+        sys.exit(1)
+
+    background = pygame.image.load(sys.argv[2])
+    if len(sys.argv) > 4:
+        # Foreground blended through the mask alpha (pre-multiplied)
+        alpha = mask_alpha(pygame.image.load(sys.argv[4]), background.get_size())
+        stats = composite_sequence(sorted(glob.glob(sys.argv[1])), background, sys.argv[3],
+                                   'blend_texture_add', alpha, 1.0, mask_=True)
+    else:
+        stats = composite_sequence(sorted(glob.glob(sys.argv[1])), background, sys.argv[3])
+    print('%(frames)s frames in %(seconds).3f s (%(fps).1f fps)' % stats)
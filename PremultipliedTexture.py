@@ -0,0 +1,239 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Pre-multiplied textures, converted once and blended with outRGB = SrcRGB + DstRGB(1 - SrcA)
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import numpy
+
+from Compositing import planes, texture_size, output_views, to_surface, div255, alpha_to_int, \
+    alpha_to_float, premultiplied_over_int, blend_texture_add_float
+
+
+class PremultipliedTexture:
+    """
+    Texture holding RGB values pre-multiplied by alpha, uint8 or float64 (normalized).
+
+    The conversion is done once by the constructor, the planes of the other precision are
+    converted on first use (see planes). Straight alpha values are only computed (un-premultiplied)
+    when the texture is exported (see straight, to_surface and save).
+    A texture used as destination (out_ of blend_premultiplied) releases its converted planes.
+    """
+
+    def __init__(self, texture_=None, alpha_: (float, numpy.ndarray) = None, float_: bool = False,
+                 size_: tuple = None):
+        """
+        :param texture_: Straight alpha texture, 32-bit Surface with per-pixel alpha or uint8 array (h, w, 4) RGBA.
+        None creates an empty (transparent) texture of size size_
+        :param alpha_: Optional alpha values replacing the alpha channel of texture_ (like set_alpha1_ of
+        blend_texture_add), float or numpy array (h, w, 1) in range [0.0 ... 1.0]
+        :param float_: True | False, hold float64 planes (same values than blend_texture_add float path)
+        instead of uint8 planes
+        :param size_: Size (w, h) of an empty texture
+        """
+        self.float = float_
+        self._converted = None
+        self._straight = None
+
+        if texture_ is None:
+            self.size = w, h = size_
+            dtype = float if float_ else numpy.uint8
+            self.rgb = numpy.zeros((h, w, 3), dtype=dtype)
+            self.alpha = numpy.zeros((h, w, 1), dtype=dtype)
+            self.mask = numpy.zeros((h, w), dtype=bool)
+            return
+
+        self.size = w, h = texture_size(texture_)
+        rgb, alpha = planes(texture_)
+        # Black pixels mask (mask_ of blend_texture_add)
+        self.mask = alpha == 0
+
+        if float_:
+            alpha = alpha[:, :, numpy.newaxis] / 255 if alpha_ is None else alpha_to_float(alpha_)
+            self.alpha = numpy.broadcast_to(numpy.asarray(alpha, dtype=float), (h, w, 1)).copy()
+            self.rgb = (rgb / 255) * alpha
+        else:
+            alpha = alpha[:, :, numpy.newaxis] if alpha_ is None else alpha_to_int(alpha_)
+            self.alpha = numpy.broadcast_to(numpy.asarray(alpha, dtype=numpy.uint8), (h, w, 1)).copy()
+            self.rgb = div255(numpy.multiply(rgb, alpha, dtype=numpy.uint16)).astype(numpy.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        converted = 0 if self._converted is None else self._converted[0].nbytes + self._converted[1].nbytes
+        return self.rgb.nbytes + self.alpha.nbytes + self.mask.nbytes + converted
+
+    def modified(self) -> None:
+        """
+        Signal that the planes changed, the converted planes and straight values are released.
+
+        :return: None
+        """
+        self._converted = None
+        self._straight = None
+
+    def planes(self, float_: bool) -> tuple:
+        """
+        :param float_: True | False, float64 normalized planes or uint8 planes
+        :return: Return a tuple (pre-multiplied RGB (h, w, 3), alpha (h, w, 1)), converted once
+        """
+        if float_ == self.float:
+            return self.rgb, self.alpha
+        if self._converted is None:
+            if float_:
+                self._converted = self.rgb / 255, self.alpha / 255
+            else:
+                self._converted = tuple((plane * 255 + 0.5).astype(numpy.uint8) for plane in (self.rgb, self.alpha))
+        return self._converted
+
+    def straight(self, out_=None):
+        """
+        Un-premultiply, RGB = RGB / A (pixels with A = 0 are black).
+        Float planes give back the source values, uint8 planes are within +/-(127 / A + 0.5) of them
+        (RGB x A rounded to 8 bits, up to 127 for A = 1).
+
+        :param out_: Optional destination, uint8 array (h, w, 4) or 32-bit Surface with per-pixel alpha
+        :return: Return the straight alpha uint8 array (h, w, 4) RGBA (computed once, read only) or out_
+        """
+        if self._straight is None:
+            w, h = self.size
+            straight = numpy.empty((h, w, 4), dtype=numpy.uint8)
+            if self.float:
+                alpha = self.alpha
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    rgb = numpy.where(alpha > 0, self.rgb / alpha, 0.0)
+                straight[:, :, :3] = numpy.minimum(rgb * 255 + 0.5, 255)
+                straight[:, :, 3] = alpha[:, :, 0] * 255 + 0.5
+            else:
+                alpha = self.alpha.astype(numpy.uint16)
+                # (RGB x 255 + A / 2) / A rounded, A = 0 only when RGB = 0
+                rgb = numpy.multiply(self.rgb, 255, dtype=numpy.uint16)
+                rgb += alpha // 2
+                numpy.floor_divide(rgb, numpy.maximum(alpha, 1), out=rgb)
+                straight[:, :, :3] = numpy.minimum(rgb, 255, out=rgb)
+                straight[:, :, 3] = self.alpha[:, :, 0]
+            straight.flags.writeable = False
+            self._straight = straight
+
+        if out_ is None:
+            return self._straight
+        rgb_out, alpha_out = output_views(out_, *self.size)
+        rgb_out[...] = self._straight[:, :, :3]
+        alpha_out[...] = self._straight[:, :, 3]
+        return out_
+
+    def to_surface(self):
+        """
+        :return: Return a new 32-bit Surface with per-pixel alpha (straight alpha)
+        """
+        return to_surface(self.straight().copy())
+
+    def save(self, path_: str) -> None:
+        """
+        Save as a straight alpha image (e.g. PNG).
+
+        :param path_: Image path
+        :return: None
+        """
+        # pygame only needed to encode the image
+        import pygame
+        pygame.image.save(self.to_surface(), path_)
+
+
+def blend_premultiplied(texture1_: PremultipliedTexture, texture2_: PremultipliedTexture,
+                        set_alpha1_: float = 1.0, set_alpha2_: float = 1.0, mask_: bool = False,
+                        integer_: bool = False, out_=None, workspace_=None):
+    """
+    Pre-multiplied "over" of texture1 on texture2, outRGB = SrcRGB + DstRGB(1 - SrcA) and
+    outA = SrcA + DstA(1 - SrcA). The planes are used as converted (no normalization, pre-multiplication
+    or division by outA per call) unless an extra opacity is given.
+
+    :param texture1_: First layer, PremultipliedTexture
+    :param texture2_: Second layer, PremultipliedTexture
+    :param set_alpha1_: Opacity of texture1 (multiplies its pre-multiplied planes when not 1.0)
+    :param set_alpha2_: Opacity of texture2 (multiplies its pre-multiplied planes when not 1.0)
+    :param mask_: True | False, black pixels of texture1 (alpha 0 in its source) are transparent
+    :param integer_: True | False, blend the uint8 planes instead of the float64 planes
+    :param out_: Optional destination, PremultipliedTexture (float planes for the float path, uint8 planes
+    for the integer path, can be texture1_ or texture2_), or uint8 array (h, w, 4) / 32-bit Surface receiving the pre-multiplied values
+    (blend_texture_add output)
+    :param workspace_: Optional BlendWorkspace, float path computed in its scratch buffers (uint8 destinations)
+    :return: Return a new PremultipliedTexture (float planes, uint8 planes with integer_) or out_
+    """
+    assert isinstance(texture1_, PremultipliedTexture) and isinstance(texture2_, PremultipliedTexture), \
+        'Expecting PremultipliedTexture for arguments texture1_ and texture2_ got %s and %s ' % (
+            type(texture1_), type(texture2_))
+    assert texture1_.size == texture2_.size, \
+        'Expecting textures with the same size got %s and %s ' % (texture1_.size, texture2_.size)
+    assert isinstance(set_alpha1_, float) and isinstance(set_alpha2_, float), \
+        'Expecting float for arguments set_alpha1_ and set_alpha2_ got %s and %s ' % (
+            type(set_alpha1_), type(set_alpha2_))
+
+    w, h = texture1_.size
+    out = PremultipliedTexture(size_=(w, h), float_=not integer_) if out_ is None else out_
+    if isinstance(out, PremultipliedTexture):
+        assert out.float != integer_ and out.size == (w, h), \
+            'Expecting PremultipliedTexture of size %s with %s planes for argument out_ ' % (
+                (w, h), 'uint8' if integer_ else 'float')
+        rgb_out, alpha_out = out.rgb, out.alpha[:, :, 0]
+    else:
+        rgb_out, alpha_out = output_views(out, w, h)
+
+    rgb1, alpha1 = texture1_.planes(not integer_)
+    rgb2, alpha2 = texture2_.planes(not integer_)
+    if integer_:
+        if set_alpha1_ != 1.0:
+            opacity = alpha_to_int(set_alpha1_)
+            rgb1 = div255(numpy.multiply(rgb1, opacity, dtype=numpy.uint16))
+            alpha1 = div255(numpy.multiply(alpha1, opacity, dtype=numpy.uint16))
+        if set_alpha2_ != 1.0:
+            opacity = alpha_to_int(set_alpha2_)
+            rgb2 = div255(numpy.multiply(rgb2, opacity, dtype=numpy.uint16))
+            alpha2 = div255(numpy.multiply(alpha2, opacity, dtype=numpy.uint16))
+        premultiplied_over_int(rgb1, alpha1, rgb2, alpha2, rgb_out, alpha_out)
+    else:
+        if set_alpha1_ != 1.0:
+            rgb1, alpha1 = rgb1 * set_alpha1_, alpha1 * set_alpha1_
+        if set_alpha2_ != 1.0:
+            rgb2, alpha2 = rgb2 * set_alpha2_, alpha2 * set_alpha2_
+        if rgb_out.dtype == numpy.uint8:
+            kernel = blend_texture_add_float if workspace_ is None else workspace_.blend_texture_add
+            kernel(rgb1, alpha1, rgb2, alpha2, rgb_out, alpha_out)
+        else:
+            # Float planes kept, the result is not rounded to 8 bits. DstRGB(1 - SrcA) and DstA(1 - SrcA)
+            # are computed before the destination is written (out_ can be texture1_ or texture2_)
+            inv_alpha1 = 1 - alpha1
+            numpy.add(rgb1, rgb2 * inv_alpha1, out=rgb_out)
+            numpy.add(alpha1, alpha2 * inv_alpha1, out=out.alpha)
+
+    if mask_:
+        rgb_out[texture1_.mask] = 0
+        alpha_out[texture1_.mask] = 0
+    if isinstance(out, PremultipliedTexture):
+        # Black pixels mask of the blend (the destination can be used as texture1_ of the next blend)
+        out.mask = alpha_out == 0
+        out.modified()
+    return out
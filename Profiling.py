@@ -0,0 +1,226 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Per-stage profiling of the blend functions (alpha_blending, blend_texture_add and the Compositing core)
+
+with StageProfiler(memory_=True) as profiler:
+    for frame in range(100):
+        blend_texture_add(surface1, surface2, 0.5, 1.0)
+print(profiler.report())
+
+Stages recorded:
+alpha_blend.planes / blend_add.planes   planes referenced from the textures, output allocated (cached planes)
+alpha_blend.index / blend_add.index     alpha ranges and tiles of the sparse index (fast paths)
+alpha_blend.blend / blend_add.blend     blend kernels (normalization, blend math, clamping, uint8 conversion)
+alpha_blending.to_surface / blend_texture_add.to_surface   Surface created from the result
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import time
+import threading
+import tracemalloc
+
+import numpy
+
+import Compositing
+
+
+class _Stage:
+    """
+    Context manager timing one stage (see StageProfiler.stage).
+    """
+
+    __slots__ = ('profiler', 'name', 'start', 'traced', 'peak')
+
+    def __init__(self, profiler_, name_: str):
+        self.profiler = profiler_
+        self.name = name_
+
+    def __enter__(self):
+        if self.profiler.memory:
+            with self.profiler.lock:
+                # The peak is reset for this stage, the stages already running keep theirs
+                self.profiler.fold_peak()
+                self.traced = self.peak = tracemalloc.get_traced_memory()[0]
+                self.profiler.active.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_):
+        seconds = time.perf_counter() - self.start
+        nbytes = 0
+        if self.profiler.memory:
+            with self.profiler.lock:
+                self.profiler.fold_peak()
+                self.profiler.active.remove(self)
+            # Bytes allocated, peak of the memory traced during the stage
+            nbytes = self.peak - self.traced
+        self.profiler.record(self.name, seconds, nbytes)
+        return False
+
+
+class StageProfiler:
+    """
+    Wall time (and bytes allocated) of each stage of the blend functions, aggregated over many calls.
+
+    Enabled within a with block (or between enable and disable), the blend functions
+    only test Compositing.PROFILER when it is disabled.
+
+    Stages can be nested and run from several threads (e.g. BlendEngine). tracemalloc traces the
+    whole process: the bytes of a stage include the allocations of the threads running at the
+    same time, profile the memory with a single thread for per-stage figures.
+    """
+
+    def __init__(self, memory_: bool = False, callback_=None):
+        """
+        :param memory_: True | False, record the bytes allocated by each stage (tracemalloc, slower)
+        :param callback_: Optional callable(name, seconds, bytes) called after each stage
+        """
+        self.memory = memory_
+        self.callback = callback_
+        self.samples = {}
+        self._previous = None
+        self._tracing = False
+        # Stages recording memory, their peak is kept across tracemalloc.reset_peak (see fold_peak)
+        self.active = []
+        self.lock = threading.Lock()
+
+    def enable(self) -> None:
+        """
+        Install the profiler (Compositing.PROFILER), the previous one is restored by disable.
+
+        :return: None
+        """
+        self._previous = Compositing.PROFILER
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        Compositing.PROFILER = self
+
+    def disable(self) -> None:
+        """
+        :return: None
+        """
+        Compositing.PROFILER = self._previous
+        self._previous = None
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_):
+        self.disable()
+        return False
+
+    def fold_peak(self) -> None:
+        """
+        Fold the traced memory peak into the stages running (nested or in other threads)
+        and reset it, tracemalloc has a single peak for the whole process. Called with lock held.
+
+        :return: None
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        for stage in self.active:
+            stage.peak = max(stage.peak, peak)
+        tracemalloc.reset_peak()
+
+    def stage(self, name_: str) -> _Stage:
+        """
+        :param name_: Stage name
+        :return: Return a context manager recording the stage
+        """
+        return _Stage(self, name_)
+
+    def record(self, name_: str, seconds_: float, bytes_: int = 0) -> None:
+        """
+        Record one sample of a stage.
+
+        :param name_: Stage name
+        :param seconds_: Wall time (seconds)
+        :param bytes_: Bytes allocated
+        :return: None
+        """
+        samples = self.samples.get(name_)
+        if samples is None:
+            samples = self.samples[name_] = ([], [])
+        samples[0].append(seconds_)
+        samples[1].append(bytes_)
+        if self.callback is not None:
+            self.callback(name_, seconds_, bytes_)
+
+    def clear(self) -> None:
+        """
+        :return: None
+        """
+        self.samples.clear()
+
+    def histogram(self, name_: str, bins_: (int, numpy.ndarray) = 10) -> tuple:
+        """
+        Distribution of the wall time of a stage.
+
+        :param name_: Stage name
+        :param bins_: Number of bins (logarithmic, between the fastest and the slowest sample) or bin edges
+        :return: Return a tuple (counts, edges in seconds), see numpy.histogram
+        """
+        seconds = numpy.asarray(self.samples[name_][0])
+        if isinstance(bins_, int):
+            low, high = max(seconds.min(), 1e-9), max(seconds.max(), 1e-9)
+            bins_ = numpy.geomspace(low, high * (1 + 1e-9), bins_ + 1)
+        return numpy.histogram(seconds, bins_)
+
+    def summary(self) -> dict:
+        """
+        :return: Return a dict stage name -> dict (calls, total, mean, median, p95 and max seconds,
+        mean and max bytes)
+        """
+        result = {}
+        for name, (seconds, nbytes) in self.samples.items():
+            seconds = numpy.asarray(seconds)
+            result[name] = {'calls': len(seconds), 'total': float(seconds.sum()),
+                            'mean': float(seconds.mean()), 'median': float(numpy.median(seconds)),
+                            'p95': float(numpy.percentile(seconds, 95)), 'max': float(seconds.max()),
+                            'mean_bytes': float(numpy.mean(nbytes)), 'max_bytes': int(max(nbytes))}
+        return result
+
+    def report(self, bins_: int = 8) -> str:
+        """
+        :param bins_: Number of bins of the histograms
+        :return: Return a text report, one line per stage (slowest first) and its histogram
+        """
+        summary = self.summary()
+        lines = ['%-32s %7s %10s %10s %10s %10s %10s' % ('stage', 'calls', 'total ms', 'mean ms',
+                                                          'p95 ms', 'max ms', 'max MB')]
+        for name in sorted(summary, key=lambda name: -summary[name]['total']):
+            stats = summary[name]
+            lines.append('%-32s %7d %10.3f %10.3f %10.3f %10.3f %10.2f' % (
+                name, stats['calls'], stats['total'] * 1e3, stats['mean'] * 1e3, stats['p95'] * 1e3,
+                stats['max'] * 1e3, stats['max_bytes'] / 1e6))
+            counts, edges = self.histogram(name, bins_)
+            lines.append('    ' + ' '.join('%.3g:%d' % (edge * 1e3, count) for edge, count in zip(edges, counts)))
+        return '\n'.join(lines)
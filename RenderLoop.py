@@ -0,0 +1,178 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Pipelined render loop, frame N + 1 blended on a worker thread while frame N is presented
+
+loop = RenderLoop(lambda index_, out_: alpha_blending(surface1, surface2, out_=out_), SIZE)
+loop.run(present)                   # or await loop.run_async(present)
+print(loop.report())
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import time
+import asyncio
+import inspect
+import concurrent.futures
+
+import pygame
+import numpy
+
+
+class RenderLoop:
+    """
+    Double buffered render loop.
+
+    render_(index, surface) draws frame index into one of two output surfaces (e.g. a blend
+    with out_=surface) on a worker thread, while present_(surface, index) shows the previous frame
+    on the calling thread (events, blit and display.flip). The blend kernels release the GIL
+    in numpy, the presentation is not stalled by the blend.
+    render_ is always called from the same worker thread (thread_workspace, TextureCache
+    are not shared with the presentation).
+    """
+
+    def __init__(self, render_, size_: tuple, target_fps_: float = 60.0, executor_=None):
+        """
+        :param render_: callable(index, surface), renders the frame index into the 32-bit surface (SRCALPHA)
+        :param size_: Size (w, h) of the output surfaces
+        :param target_fps_: Display rate, a frame presented later than 1 / target_fps_ drops frames
+        :param executor_: Optional single worker executor (default a ThreadPoolExecutor owned by the loop)
+        """
+        assert callable(render_), \
+            'Expecting callable for argument render_ got %s ' % type(render_)
+        assert target_fps_ > 0, \
+            'Expecting positive target_fps_ got %s ' % target_fps_
+        self.render = render_
+        self.period = 1.0 / target_fps_
+        self.executor = executor_
+        self.buffers = [pygame.Surface(size_, pygame.SRCALPHA, 32) for _ in range(2)]
+        self.render_times = []
+        self.wait_times = []
+        self.presents = []
+
+    def _render(self, index_: int) -> pygame.Surface:
+        # Frames alternate between the two buffers, the one presented is never written
+        surface = self.buffers[index_ % 2]
+        start = time.perf_counter()
+        self.render(index_, surface)
+        self.render_times.append(time.perf_counter() - start)
+        return surface
+
+    def _start(self):
+        self.render_times.clear()
+        self.wait_times.clear()
+        self.presents.clear()
+        return self.executor or concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='RenderLoop')
+
+    def run(self, present_, frames_: int = None) -> dict:
+        """
+        Run the loop until present_ returns False (or frames_ frames are presented).
+
+        :param present_: callable(surface, index), presents a frame, returns False to stop
+        :param frames_: Optional number of frames
+        :return: Return the statistics (see stats)
+        """
+        executor = self._start()
+        future = executor.submit(self._render, 0)
+        index = 0
+        try:
+            while frames_ is None or index < frames_:
+                start = time.perf_counter()
+                surface = future.result()
+                self.wait_times.append(time.perf_counter() - start)
+                # Frame N + 1 rendered in the other buffer while frame N is presented
+                future = executor.submit(self._render, index + 1) \
+                    if frames_ is None or index + 1 < frames_ else None
+                if present_(surface, index) is False:
+                    break
+                self.presents.append(time.perf_counter())
+                index += 1
+        finally:
+            # The pending frame writes into a buffer, wait for it
+            if future is not None:
+                concurrent.futures.wait([future])
+            if executor is not self.executor:
+                executor.shutdown()
+        return self.stats()
+
+    async def run_async(self, present_, frames_: int = None) -> dict:
+        """
+        Asyncio version of run, the event loop is free while a frame is rendered.
+
+        :param present_: callable(surface, index) or coroutine function, presents a frame,
+        returns False to stop
+        :param frames_: Optional number of frames
+        :return: Return the statistics (see stats)
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._start()
+        future = loop.run_in_executor(executor, self._render, 0)
+        index = 0
+        try:
+            while frames_ is None or index < frames_:
+                start = time.perf_counter()
+                surface = await future
+                self.wait_times.append(time.perf_counter() - start)
+                future = loop.run_in_executor(executor, self._render, index + 1) \
+                    if frames_ is None or index + 1 < frames_ else None
+                result = present_(surface, index)
+                if inspect.isawaitable(result):
+                    result = await result
+                if result is False:
+                    break
+                self.presents.append(time.perf_counter())
+                index += 1
+        finally:
+            if future is not None:
+                await asyncio.wait([future])
+            if executor is not self.executor:
+                executor.shutdown()
+        return self.stats()
+
+    def stats(self) -> dict:
+        """
+        :return: Return a dict with the frames presented, fps, frame time (interval between two
+        presentations), render time (worker), wait time (presentation stalled by the render) in ms,
+        and the number of dropped frames (display periods missed)
+        """
+        intervals = numpy.diff(self.presents) if len(self.presents) > 1 else numpy.zeros(1)
+        render = numpy.asarray(self.render_times or [0.0])
+        wait = numpy.asarray(self.wait_times or [0.0])
+        dropped = int(numpy.maximum(numpy.round(intervals / self.period) - 1, 0).sum())
+        elapsed = self.presents[-1] - self.presents[0] if len(self.presents) > 1 else 0.0
+        return {'frames': len(self.presents),
+                'fps': (len(self.presents) - 1) / elapsed if elapsed > 0 else 0.0,
+                'frame_ms': float(intervals.mean() * 1e3), 'frame_ms_p95': float(numpy.percentile(intervals, 95) * 1e3),
+                'frame_ms_max': float(intervals.max() * 1e3),
+                'render_ms': float(render.mean() * 1e3), 'render_ms_max': float(render.max() * 1e3),
+                'wait_ms': float(wait.mean() * 1e3), 'dropped': dropped}
+
+    def report(self) -> str:
+        """
+        :return: Return the statistics as text
+        """
+        return ('%(frames)d frames, %(fps).1f fps, frame %(frame_ms).2f ms (p95 %(frame_ms_p95).2f, '
+                'max %(frame_ms_max).2f), render %(render_ms).2f ms, wait %(wait_ms).2f ms, '
+                '%(dropped)d dropped' % self.stats())
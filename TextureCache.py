@@ -0,0 +1,189 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Cache of the arrays extracted from pygame surfaces (normalized, pre-multiplied planes and masks)
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import weakref
+from collections import OrderedDict
+
+import pygame
+import numpy
+
+from Compositing import planes, alpha_tiles, alpha_to_float
+
+
+class TextureCache:
+    """
+    LRU cache of the per surface planes used by the blend functions.
+
+    Entries are keyed on the surface identity and its contents version. pygame does not
+    track modifications, call invalidate(surface) after drawing into a cached surface.
+    Alpha arrays passed as keys (set_alpha_) are considered read only.
+    Entries of a surface are dropped when the surface is garbage collected.
+    """
+
+    def __init__(self, max_bytes_: int = 64 * 1024 * 1024):
+        """
+        :param max_bytes_: Memory budget (bytes), least recently used entries are evicted above it
+        """
+        assert isinstance(max_bytes_, int) and max_bytes_ > 0, \
+            'Expecting positive int for argument max_bytes_ got %s ' % max_bytes_
+        self.max_bytes = max_bytes_
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # id(surface) -> [version, weakref]
+        self._surfaces = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def version(self, surface_: pygame.Surface) -> int:
+        """
+        :param surface_: pygame Surface
+        :return: Return the contents version of the surface (0 until invalidated)
+        """
+        record = self._surfaces.get(id(surface_))
+        return 0 if record is None else record[0]
+
+    def invalidate(self, surface_: pygame.Surface) -> None:
+        """
+        Signal that the surface pixels changed, its cached entries are released.
+
+        :param surface_: pygame Surface
+        :return: None
+        """
+        record = self._surfaces.get(id(surface_))
+        if record is not None:
+            record[0] += 1
+            self._forget(id(surface_))
+
+    def clear(self) -> None:
+        """
+        Release all the entries (surface versions are kept).
+
+        :return: None
+        """
+        self._entries.clear()
+        self.nbytes = 0
+
+    def get(self, surface_: pygame.Surface, name_: str, builder_, key_: tuple = (),
+            keep_: object = None) -> numpy.ndarray:
+        """
+        Return the cached array, build and store it on a miss.
+
+        :param surface_: pygame Surface the array is derived from
+        :param name_: Plane name (e.g. 'rgb', 'mask')
+        :param builder_: Callable without argument returning the array
+        :param key_: Extra hashable key (e.g. the alpha value used for a pre-multiplied plane)
+        :param keep_: Object kept alive with the entry (e.g. an alpha array referenced by id in key_)
+        :return: Return a numpy array (must not be modified by the caller)
+        """
+        key = (id(surface_), self._track(surface_), name_) + key_
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        array = builder_()
+        array.flags.writeable = False
+        self._entries[key] = (array, keep_)
+        self.nbytes += array.nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return array
+
+    def rgb(self, surface_: pygame.Surface) -> numpy.ndarray:
+        """
+        :param surface_: 24-32 bit pygame Surface
+        :return: Return a contiguous uint8 array (h, w, 3) of the surface RGB values
+        """
+        return self.get(surface_, 'rgb', lambda: numpy.ascontiguousarray(planes(surface_)[0]))
+
+    def normalized(self, surface_: pygame.Surface) -> numpy.ndarray:
+        """
+        :param surface_: 24-32 bit pygame Surface
+        :return: Return a float64 array (h, w, 3) of the surface RGB values / 255
+        """
+        return self.get(surface_, 'normalized', lambda: self.rgb(surface_) / 255)
+
+    def premultiplied(self, surface_: pygame.Surface, set_alpha_: (float, numpy.ndarray)) -> numpy.ndarray:
+        """
+        :param surface_: 24-32 bit pygame Surface
+        :param set_alpha_: Alpha values (float or numpy array, uint8 arrays in range [0 ... 255]) used to
+        pre-multiply the RGB values
+        :return: Return a float64 array (h, w, 3), RGB values / 255 x alpha
+        """
+        key = (set_alpha_,) if isinstance(set_alpha_, float) else (id(set_alpha_),)
+        return self.get(surface_, 'premultiplied', lambda: self.normalized(surface_) * alpha_to_float(set_alpha_),
+                        key, set_alpha_)
+
+    def mask(self, surface_: pygame.Surface) -> numpy.ndarray:
+        """
+        :param surface_: 32 bit pygame Surface with per-pixel alpha
+        :return: Return a bool array (h, w) flagging the fully transparent pixels
+        """
+        return self.get(surface_, 'mask', lambda: planes(surface_)[1] == 0)
+
+    def alpha_tiles(self, surface_: pygame.Surface, tile_: int) -> numpy.ndarray:
+        """
+        :param surface_: 32 bit pygame Surface with per-pixel alpha
+        :param tile_: Tile size (pixels)
+        :return: Return a uint8 array (2, rows, columns), min and max alpha per tile (see Compositing.alpha_tiles)
+        """
+        return self.get(surface_, 'alpha_tiles', lambda: alpha_tiles(surface_, tile_), (tile_,))
+
+    def _track(self, surface_: pygame.Surface) -> int:
+        """
+        Register the surface (weak reference) and return its version.
+        """
+        record = self._surfaces.get(id(surface_))
+        if record is None:
+            surface_id = id(surface_)
+            record = [0, weakref.ref(surface_, lambda _: self._release(surface_id))]
+            self._surfaces[surface_id] = record
+        return record[0]
+
+    def _release(self, surface_id_: int) -> None:
+        """
+        Weak reference callback, the surface no longer exists.
+        """
+        self._surfaces.pop(surface_id_, None)
+        self._forget(surface_id_)
+
+    def _forget(self, surface_id_: int) -> None:
+        """
+        Drop all the entries derived from a surface.
+        """
+        for key in [key for key in self._entries if key[0] == surface_id_]:
+            array, _ = self._entries.pop(key)
+            self.nbytes -= array.nbytes
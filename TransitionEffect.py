@@ -32,96 +32,80 @@ import pygame
 import numpy
 import timeit
 
+from BlendTexture import blend_texture_add
+from MaskPyramid import MaskRegistry
+from RenderLoop import RenderLoop
+from Compositing import div255, output_views, to_surface
 
-def blend_texture_add(surface1_: pygame.Surface, surface2_: pygame.Surface,
-                      set_alpha1_: (float, numpy.ndarray),
-                      set_alpha2_: (float, numpy.ndarray), mask_: bool = False) -> pygame.Surface:
-    """
 
-    :param surface1_: First layer texture
-    :param surface2_: Second layer texture
-    :param set_alpha1_: Alpha values for surface1 (can be a float or a numpy array)
-    :param set_alpha2_: Alpha values for surface2 (can be a flaot or a numpy array)
-    :param mask_: True | False, create a mask from surface1 (only black pixels)
-    :return: Return a pygame surface (blend between surface1 & surface2)
+class Transition:
     """
+    Transition effect between 2 layers, blend_texture_add with a scalar alpha t for surface1.
 
-    assert isinstance(surface1_, pygame.Surface), \
-        'Expecting Surface for argument surface got %s ' % type(surface1_)
-    assert isinstance(surface2_, pygame.Surface), \
-        'Expecting Surface for argument surface2_ got %s ' % type(surface2_)
-    assert isinstance(set_alpha1_, (float, numpy.ndarray)), \
-        'Expecting float or numpy.ndarray for argument set_alpha1_ got %s ' % type(set_alpha1_)
-    assert isinstance(set_alpha2_, (float, numpy.ndarray)), \
-        'Expecting float for argument set_alpha2_ got %s ' % type(set_alpha2_)
-
-    # sizes
-    w, h = surface1_.get_width(), surface1_.get_height()
-
-    # Create a BufferProxy for surface1_ and 2
-    # '3' returns a (surface-width, surface-height, 3) array of RGB color components.
-    #  Each of the red, green, and blue components are unsigned bytes.
-    # Only 24-bit and 32-bit surfaces are supported.
-    # The color components must be in either RGB or BGR order within the pixel.
-    buffer1 = surface1_.get_view('3')
-    buffer2 = surface2_.get_view('3')
-
-    # Extract the alpha channel from surface1 and create
-    # a mask (array with black pixels flagged) alpha1_ <= 0
-    if isinstance(mask_, bool):
-        # Extract the surface1_ alpha channel and create a mask_ for (black pixel)
-        alpha1_ = numpy.array(surface1_.get_view('a'), dtype=numpy.uint8).transpose(1, 0) / 255
-        mask_alpha1 = alpha1_ <= 0
-
-    if isinstance(set_alpha1_, float):
-        # Create alpha channels alpha1 and alpha2
-        alpha1 = numpy.full((w, h, 1), set_alpha1_).transpose(1, 0, 2)
-    elif isinstance(set_alpha1_, numpy.ndarray):
-        alpha1 = set_alpha1_
-
-    if isinstance(set_alpha2_, float):
-        # Create alpha channels alpha1 and alpha2
-        alpha2 = numpy.full((w, h, 1), set_alpha2_).transpose(1, 0, 2)
-    elif isinstance(set_alpha2_, numpy.ndarray):
-        alpha2 = set_alpha2_
-
-    # -------------------  pre-multiplied -------------------
-    # 1) create arrays representing surface1_ and surface2_, swap row and column and normalize.
-    # 2 ) pre - multiplied alphas
-    rgb1 = (numpy.array(buffer1, dtype=numpy.uint8).transpose(1, 0, 2) / 255) * alpha1
-    rgb2 = (numpy.array(buffer2, dtype=numpy.uint8).transpose(1, 0, 2) / 255) * alpha2
-
-    # create the output array RGBA
-    new = numpy.zeros((w, h, 4))
-
-    # Calculations for RGB values -> outRGB = SrcRGB + DstRGB(1 - SrcA)
-    new[:, :, :3] = numpy.add(rgb1, rgb2 * (1 - alpha1))
-    # Calculation for alpha channel -> outA = SrcA + DstA(1 - SrcA)
-    new[:, :, 3] = numpy.add(alpha1, alpha2 * (1 - alpha1)).reshape(w, h)
-    # -------------------  pre-multiplied -------------------
-    """
-    # ------------------- non pre-multiplied -------------------
-    # Formula to apply to each pixels:
-    # outRGB = (SrcRGB x SrcA + DstRGB x DstA x (1 - SrcA) / ( SrcA + DstA(1 - SrcA))
-    # OutA = SrcA + DstA(1 - SrcA)
-    rgb1 = (numpy.array(buffer1, dtype=numpy.uint8).transpose(1, 0, 2) / 255) * alpha1
-    rgb2 = (numpy.array(buffer2, dtype=numpy.uint8).transpose(1, 0, 2) / 255) * alpha2
-    new[:, :, 3] = alpha1[0] + alpha2[0] * (1 - alpha1[0])
-    new[:, :, :3] = rgb1 * alpha1 + rgb2 * alpha2 * (1 - alpha1) / (alpha1 + alpha2 * (1 - alpha1))
-    # ------------------- non pre-multiplied -------------------
+    With a scalar SrcA = t the pre-multiplied blend is affine in t:
+    outRGB = DstRGB x DstA + t x (SrcRGB - DstRGB x DstA)
+    outA = DstA + t x (1 - DstA)
+    The frames t = 0 (B) and t = 1 (A) are computed once, any frame t is then
+    out = (A x t + B x (1 - t)) in uint16 fixed point (t in 1/255 steps), within +/-1 of blend_texture_add.
     """
 
-    # De-normalization
-    new = numpy.multiply(new, 255)
-
-    # Capping all the values over 255
-    numpy.putmask(new, new > 255, 255)
-
-    # Apply the mask_ to the new surface
-    if mask_:
-        new[mask_alpha1] = 0
-    return pygame.image.frombuffer(new.copy('C').astype(numpy.uint8),
-                                   (w, h), 'RGBA')
+    def __init__(self, surface1_: pygame.Surface, surface2_: pygame.Surface,
+                 set_alpha2_: (float, numpy.ndarray) = 1.0, mask_: bool = False, table_: bool = False):
+        """
+        :param surface1_: First layer texture
+        :param surface2_: Second layer texture
+        :param set_alpha2_: Alpha values for surface2 (can be a float or a numpy array) in range [0.0 ... 1.0]
+        :param mask_: True | False, create a mask from surface1 (only black pixels)
+        :param table_: True | False, pre-compute the 256 frames (256 x w x h x 4 bytes).
+        """
+        self.size = w, h = surface1_.get_size()
+        frame1 = blend_texture_add(surface1_, surface2_, 1.0, set_alpha2_, mask_,
+                                   out_=numpy.empty((h, w, 4), dtype=numpy.uint8))
+        frame0 = blend_texture_add(surface1_, surface2_, 0.0, set_alpha2_, mask_,
+                                   out_=numpy.empty((h, w, 4), dtype=numpy.uint8))
+        self.frame1 = frame1.astype(numpy.uint16)
+        self.frame0 = frame0.astype(numpy.uint16)
+        # Scratch buffers, frame() does not allocate
+        self._buffer1 = numpy.empty((h, w, 4), dtype=numpy.uint16)
+        self._buffer2 = numpy.empty((h, w, 4), dtype=numpy.uint16)
+
+        self.table = None
+        if table_:
+            self.table = numpy.empty((256, h, w, 4), dtype=numpy.uint8)
+            for i in range(256):
+                self.table[i] = self._interpolate(i)
+
+    def _interpolate(self, i_: int) -> numpy.ndarray:
+        """
+        :param i_: Transition step in range [0 ... 255]
+        :return: Return the uint16 scratch array (h, w, 4) holding the frame (A x i + B x (255 - i)) / 255
+        """
+        numpy.multiply(self.frame1, i_, out=self._buffer1)
+        numpy.multiply(self.frame0, 255 - i_, out=self._buffer2)
+        # Both weights sum up to 255 (no overflow)
+        self._buffer1 += self._buffer2
+        return div255(self._buffer1)
+
+    def frame(self, t_: float, out_: (pygame.Surface, numpy.ndarray) = None) -> (pygame.Surface, numpy.ndarray):
+        """
+        Render the transition for alpha t (same as blend_texture_add(surface1, surface2, t, ...)).
+
+        :param t_: Alpha value for surface1 in range [0.0 ... 1.0]
+        :param out_: Optional destination, 32-bit Surface with per-pixel alpha or uint8 array (h, w, 4)
+        :return: Return a pygame surface or out_
+        """
+        assert isinstance(t_, float), \
+            'Expecting float for argument t_ got %s ' % type(t_)
+        i = int(min(max(t_, 0.0), 1.0) * 255 + 0.5)
+        new = self._interpolate(i) if self.table is None else self.table[i]
+
+        w, h = self.size
+        out = numpy.empty((h, w, 4), dtype=numpy.uint8) if out_ is None else out_
+        rgb_out, alpha_out = output_views(out, w, h)
+        rgb_out[...] = new[:, :, :3]
+        alpha_out[...] = new[:, :, 3]
+        del rgb_out, alpha_out
+        return to_surface(out) if out_ is None else out_
 
 
 if __name__ == '__main__':
@@ -147,11 +131,10 @@ if __name__ == '__main__':
     # surface1_mask = numpy.repeat(gradient[:, numpy.newaxis], [surface1.get_height()], 1).reshape((256, 256, 1)) / 255
     # surface1_mask.transpose(1, 0, 2)
 
-    # Create an alpha channel from a the image radial1_inverted.png
-    mask = pygame.image.load('Assets\\radial1_inverted.png').convert_alpha()
-    mask = pygame.transform.smoothscale(mask, SIZE)
-    surface1_mask = pygame.surfarray.array_alpha(mask)
-    surface1_mask = surface1_mask.reshape((256, 256, 1)) / 255
+    # Create an alpha channel from a the image radial1_inverted.png (served at SIZE by the mask registry)
+    masks = MaskRegistry()
+    masks.register('radial1_inverted', 'Assets\\radial1_inverted.png')
+    surface1_mask = masks.get('radial1_inverted', SIZE)
 
     """
     # Create alpha channel from the image radial1
@@ -173,19 +156,21 @@ if __name__ == '__main__':
     #      (timeit.timeit("blend_texture_add(surface1, surface2, 80 / 255, 255 / 255, mask_=False)",
     #      "from __main__ import blend_texture_add, surface1, surface2", number=N)/N))
 
-    i = 255
-    done = False
-    while not done:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                done = True
-        # Create a transition effect between 2 layers
-        texture = blend_texture_add(surface1, surface2, i / 255, 255 / 255, mask_=True)
+    # The two layers do not change, only the alpha of surface1
+    transition = Transition(surface1, surface2, 255 / 255, mask_=True)
 
-        i -= 1
-        if i == 0:
-            i = 255
+    # Create a transition effect between 2 layers (alpha 255 / 255 down to 1 / 255, then again)
+    # texture = blend_texture_add(surface1, surface2, i / 255, 255 / 255, mask_=True)
+    # Frames rendered on the render thread, written in place into the two output surfaces in turn
+    loop = RenderLoop(lambda index_, texture_: transition.frame((255 - index_ % 255) / 255, out_=texture_), SIZE)
 
+    def present(texture_, index_):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
         screen.blit(background, (0, 0))
-        screen.blit(texture, (0, 0))
-        pygame.display.flip()
\ No newline at end of file
+        screen.blit(texture_, (0, 0))
+        pygame.display.flip()
+
+    loop.run(present)
+    print(loop.report())
\ No newline at end of file
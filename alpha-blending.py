@@ -32,14 +32,44 @@ import pygame
 import numpy
 import timeit
 
-
-def alpha_blending(surface1_: pygame.Surface, surface2_: pygame.Surface) -> pygame.Surface:
+from TextureCache import TextureCache
+from BlendWorkspace import BlendWorkspace, thread_workspace
+from RenderLoop import RenderLoop
+from PremultipliedTexture import PremultipliedTexture, blend_premultiplied
+from Compositing import jit, stage, alpha_blend, planes, to_surface, alpha_blending_loop
+
+
+def alpha_blending(surface1_: (pygame.Surface, PremultipliedTexture),
+                   surface2_: (pygame.Surface, PremultipliedTexture),
+                   integer_: bool = False,
+                   out_: (pygame.Surface, numpy.ndarray, PremultipliedTexture) = None,
+                   kernel_: str = None, cache_: TextureCache = None,
+                   workspace_: BlendWorkspace = None) -> (pygame.Surface, numpy.ndarray, PremultipliedTexture):
     """
     Alpha blending algorithm
 
-    :param surface1_: First layer texture (foreground)
-    :param surface2_: Second layer texture (background)
-    :return: Return a pygame surface (blend between surface1 & surface2)
+    With a PremultipliedTexture layer the pre-multiplied equations are used (no division by outA),
+    a straight layer is converted on the fly (float planes). The result is un-premultiplied into a new
+    Surface (or out_), within +/-1 of the straight blend, a PremultipliedTexture out_ (or blend_premultiplied)
+    keeps it pre-multiplied. A PremultipliedTexture layer with uint8 planes holds RGB x A rounded to 8 bits,
+    the colours of the low alphas are lost: the un-premultiplied result is within +/-(1 + 255 / outA)
+    (up to 127 at low outA), use float_ layers when the straight result matters.
+
+    :param surface1_: First layer texture (foreground), Surface or PremultipliedTexture
+    :param surface2_: Second layer texture (background), Surface or PremultipliedTexture
+    :param integer_: True | False, use the uint16 fixed point path instead of float64
+    (result within +/-1 of the float path). PremultipliedTexture layers are blended in float unless out_
+    is a PremultipliedTexture with uint8 planes
+    :param out_: Optional destination, 32-bit Surface with per-pixel alpha or uint8 array (h, w, 4)
+    (or PremultipliedTexture with pre-multiplied layers).
+    The blend is written in place and out_ is returned (no new Surface), the float path still allocates
+    its float temporaries on each call unless workspace_ is given
+    :param kernel_: Kernel, 'numpy', 'fused' or 'lut' (8-bit reciprocal table) (default KERNEL, see set_kernel)
+    :param cache_: Optional TextureCache, the alpha ranges selecting the fast paths (opaque / transparent
+    foreground, opaque background) are computed once per surface
+    :param workspace_: Optional BlendWorkspace, float path computed in re-used scratch buffers (same result
+    with the default float64 precision, within +/-1 with an opt-in float32 workspace)
+    :return: Return a pygame surface (blend between surface1 & surface2) or out_
     """
 
     """
@@ -70,58 +100,37 @@ def alpha_blending(surface1_: pygame.Surface, surface2_: pygame.Surface) -> pyga
     Compatible with 32 bit only
     """
 
-    assert isinstance(surface1_, pygame.Surface), \
-        'Expecting Surface for argument surface got %s ' % type(surface1_)
-    assert isinstance(surface2_, pygame.Surface), \
-        'Expecting Surface for argument surface2_ got %s ' % type(surface2_)
-
-    # sizes
-    w, h = surface1_.get_size()
-
-    # Create a BufferProxy for surface1_ and 2
-    # '3' returns a (surface-width, surface-height, 3) array of RGB color components.
-    #  Each of the red, green, and blue components are unsigned bytes.
-    # Only 24-bit and 32-bit surfaces are supported.
-    # The color components must be in either RGB or BGR order within the pixel.
-    buffer1 = surface1_.get_view('3')
-    buffer2 = surface2_.get_view('3')
-
-    # Extract RGB values (source -> rgb1, destination -> rgb2)
-    rgb1 = (numpy.array(buffer1, dtype=numpy.uint8).transpose(1, 0, 2) / 255)
-    rgb2 = (numpy.array(buffer2, dtype=numpy.uint8).transpose(1, 0, 2) / 255)
-
-    # create the output array RGBA
-    new = numpy.zeros((w, h, 4))
-
-    # ---------------- background opaque ---------------------------
-    # Extract the alpha channels from surface1 & surface2
-    # alpha1 = (numpy.array(surface1_.get_view('a'), dtype=numpy.uint8).transpose(1, 0)).reshape(w, h, 1) / 255
-    # alpha2 = (numpy.array(surface2_.get_view('a'), dtype=numpy.uint8).transpose(1, 0)).reshape(w, h, 1) / 255
-    # new[:, :, 3] = 1  # outA
-    # new[:, :, :3] = (rgb1 * alpha1 + rgb2 * alpha2 * (1 - alpha1))  # outRGB
-
-    # ---------------- background partially transparent ------------
-    # Extract the alpha channels from surface1 & surface2
-    alpha1 = (numpy.array(surface1_.get_view('a'), dtype=numpy.uint8).transpose(1, 0)) / 255
-    alpha2 = (numpy.array(surface2_.get_view('a'), dtype=numpy.uint8).transpose(1, 0)) / 255
-    new[:, :, 3] = alpha1 + alpha2 * (1 - alpha1)
-    alpha1 = alpha1.reshape(w, h, 1)
-    alpha2 = alpha2.reshape(w, h, 1)
-    new[:, :, :3] = (rgb1 * alpha1 + rgb2 * alpha2 * (1 - alpha1)) / (alpha1 + alpha2 * (1 - alpha1))
-
-    # De-normalization
-    new = numpy.multiply(new, 255)
-
-    # Capping all the values over 255
-    # numpy.putmask(new, new > 255, 255)
-
-    return pygame.image.frombuffer(new.copy('C').astype(numpy.uint8),
-                                   (w, h), 'RGBA')
+    assert isinstance(surface1_, (pygame.Surface, PremultipliedTexture)), \
+        'Expecting Surface or PremultipliedTexture for argument surface got %s ' % type(surface1_)
+    assert isinstance(surface2_, (pygame.Surface, PremultipliedTexture)), \
+        'Expecting Surface or PremultipliedTexture for argument surface2_ got %s ' % type(surface2_)
+
+    if isinstance(surface1_, PremultipliedTexture) or isinstance(surface2_, PremultipliedTexture):
+        # outRGB = SrcRGB + DstRGB x (1 - SrcA), un-premultiplied unless out_ is a PremultipliedTexture.
+        # Blended in float (8-bit pre-multiplied values lose the colours of the low alphas),
+        # unless out_ keeps uint8 planes
+        integer = isinstance(out_, PremultipliedTexture) and not out_.float
+        texture1, texture2 = [surface if isinstance(surface, PremultipliedTexture)
+                              else PremultipliedTexture(surface, float_=not integer)
+                              for surface in (surface1_, surface2_)]
+        out = blend_premultiplied(texture1, texture2, integer_=integer, workspace_=workspace_,
+                                  out_=out_ if isinstance(out_, PremultipliedTexture) else None)
+        if out_ is None:
+            return out.to_surface()
+        return out if out is out_ else out.straight(out_)
+
+    # Blend the RGB values and alpha channels (source -> 1, destination -> 2) referenced without copy
+    out = alpha_blend(surface1_, surface2_, integer_, out_, kernel_, cache_, workspace_)
+    if out_ is not None:
+        return out_
+    with stage('alpha_blending.to_surface'):
+        return to_surface(out)
 
 
 def alpha_blending_1(surface1_: pygame.Surface, surface2_: pygame.Surface) -> pygame.Surface:
     """
-    Same method than alpha_blending but much slower (looping over all pixels).
+    Same method than alpha_blending looping over all pixels (alpha_blending_loop).
+    Much slower unless numba is installed (compiled loop).
 
     :param surface1_: First layer texture (foreground)
     :param surface2_: Second layer texture (background)
@@ -136,23 +145,8 @@ def alpha_blending_1(surface1_: pygame.Surface, surface2_: pygame.Surface) -> py
     # sizes
     w, h = surface1_.get_size()
 
-    # Create a BufferProxy for surface1_ and 2
-    # '3' returns a (surface-width, surface-height, 3) array of RGB color components.
-    #  Each of the red, green, and blue components are unsigned bytes.
-    # Only 24-bit and 32-bit surfaces are supported.
-    # The color components must be in either RGB or BGR order within the pixel.
-    buffer1 = surface1_.get_view('3')
-    buffer2 = surface2_.get_view('3')
-
-    # Extract RGB values (source -> rgb1, destination -> rgb2)
-    rgb1 = (numpy.array(buffer1, dtype=numpy.uint8).transpose(1, 0, 2) / 255)
-    rgb2 = (numpy.array(buffer2, dtype=numpy.uint8).transpose(1, 0, 2) / 255)
-
-    # create the output array RGBA
-    new = numpy.zeros((w, h, 4))
-    # Extract the alpha channels from surface1 & surface2
-    alpha1 = (numpy.array(surface1_.get_view('a'), dtype=numpy.uint8).transpose(1, 0)).reshape(w, h, 1) / 255
-    alpha2 = (numpy.array(surface2_.get_view('a'), dtype=numpy.uint8).transpose(1, 0)).reshape(w, h, 1) / 255
+    # create the output array RGBA (rows, columns)
+    new = numpy.empty((h, w, 4), dtype=numpy.uint8)
 
     """
     # -------------- background opaque--------------
@@ -163,18 +157,11 @@ def alpha_blending_1(surface1_: pygame.Surface, surface2_: pygame.Surface) -> py
     # --------------- background not opaque --------
     """
 
-    for i in range(w):
-        for j in range(h):
-            alpha = alpha1[i][j] + alpha2[i][j] * (1 - alpha1[i][j])
-            assert alpha > 0, 'Incorrect alpha value, Division by zero.'
-            rgb = (rgb1[i][j] * alpha1[i][j] + rgb2[i][j] * alpha2[i][j] * (1 - alpha1[i][j])) / alpha
-            new[i][j] = (*rgb, alpha)
+    loop = jit(alpha_blending_loop) or alpha_blending_loop
+    loop(*planes(surface1_), *planes(surface2_), new[:, :, :3], new[:, :, 3])
 
-            # De-normalization
-    new = numpy.multiply(new, 255)
+    return to_surface(new)
 
-    return pygame.image.frombuffer(new.copy('C').astype(numpy.uint8),
-                                   (w, h), 'RGBA')
 
 if __name__ == '__main__':
     pygame.init()
@@ -210,13 +197,20 @@ if __name__ == '__main__':
           (timeit.timeit("alpha_blending_1(surface1, surface2)",
                          "from __main__ import alpha_blending_1, surface1, surface2", number=N) / N))
     """
-    done = False
-    while not done:
+    # Alpha ranges (fast path selection) computed once for both layers
+    cache = TextureCache()
+
+    # Alpha Blending on the render thread, written in place into the two output surfaces in turn
+    # (scratch buffers of the float kernel re-used every frame)
+    loop = RenderLoop(lambda index_, texture_: alpha_blending(
+        surface1, surface2, out_=texture_, cache_=cache, workspace_=thread_workspace()), SIZE)
+
+    def present(texture_, index_):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                done = True
-        # Alpha Blending
-        texture = alpha_blending(surface1, surface2)
-
-        screen.blit(texture, (0, 0))
+                return False
+        screen.blit(texture_, (0, 0))
         pygame.display.flip()
+
+    loop.run(present)
+    print(loop.report())
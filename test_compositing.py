@@ -0,0 +1,176 @@
+"""
+This code comes with a MIT license.
+
+Copyright (c) 2018 Yoann Berenguer
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+Please acknowledge and give reference if using the source code for your project(s)
+"""
+
+"""
+Blend kernels compared with the original float64 equations (python -m pytest -q)
+"""
+
+__author__ = "Yoann Berenguer"
+__copyright__ = "Copyright 2007"
+__credits__ = ["Yoann Berenguer"]
+__license__ = "MIT"
+__version__ = "1.0.0"
+__maintainer__ = "Yoann Berenguer"
+__email__ = "yoyoberenguer@hotmail.com"
+__status__ = "Demo"
+
+import os
+
+# No display needed, the surfaces are only used as pixel buffers
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+import numpy
+import pytest
+
+from Compositing import alpha_blend, blend_add
+from BlendEngine import BlendEngine
+from CompositeStack import composite_stack
+from DirtyRect import DirtyRectCompositor
+from OutOfCore import composite_tiles
+
+# (w, h), odd sizes and sizes that are not a multiple of the tile size
+SIZES = [(1, 1), (67, 45), (131, 3), (200, 129)]
+
+
+def reference_alpha_blending(texture1_: numpy.ndarray, texture2_: numpy.ndarray) -> numpy.ndarray:
+    """
+    alpha_blending of the original version on uint8 arrays (h, w, 4), float64 and truncated.
+    """
+    rgb1, rgb2 = texture1_[:, :, :3] / 255, texture2_[:, :, :3] / 255
+    alpha1, alpha2 = texture1_[:, :, 3:] / 255, texture2_[:, :, 3:] / 255
+    new = numpy.zeros(texture1_.shape)
+    new[:, :, 3:] = alpha1 + alpha2 * (1 - alpha1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        new[:, :, :3] = (rgb1 * alpha1 + rgb2 * alpha2 * (1 - alpha1)) / (alpha1 + alpha2 * (1 - alpha1))
+    # 0 / 0 (both alphas 0) is cast to 0
+    return numpy.nan_to_num(new * 255).astype(numpy.uint8)
+
+
+def reference_blend_texture_add(texture1_: numpy.ndarray, texture2_: numpy.ndarray,
+                                set_alpha1_: (float, numpy.ndarray), set_alpha2_: (float, numpy.ndarray),
+                                mask_: bool) -> numpy.ndarray:
+    """
+    blend_texture_add of the original version on uint8 arrays (h, w, 4), float64 and truncated.
+    """
+    rgb1 = texture1_[:, :, :3] / 255 * set_alpha1_
+    rgb2 = texture2_[:, :, :3] / 255 * set_alpha2_
+    new = numpy.zeros(texture1_.shape)
+    new[:, :, :3] = rgb1 + rgb2 * (1 - set_alpha1_)
+    new[:, :, 3:] = set_alpha1_ + set_alpha2_ * (1 - set_alpha1_)
+    new = numpy.minimum(new * 255, 255)
+    if mask_:
+        new[texture1_[:, :, 3] == 0] = 0
+    return new.astype(numpy.uint8)
+
+
+def texture(size_: tuple, seed_: int, alpha_: str = 'random') -> numpy.ndarray:
+    """
+    :param size_: (w, h)
+    :param seed_: Random seed
+    :param alpha_: 'random', 'opaque' or 'sparse' (transparent, opaque and random tiles)
+    :return: Return a random uint8 array (h, w, 4) RGBA
+    """
+    w, h = size_
+    array = numpy.random.default_rng(seed_).integers(0, 256, (h, w, 4), dtype=numpy.uint8)
+    if alpha_ == 'opaque':
+        array[:, :, 3] = 255
+    elif alpha_ == 'sparse':
+        array[:h // 2, :, 3] = 0
+        array[h // 2:, :w // 3, 3] = 255
+    return array
+
+
+def surface(array_: numpy.ndarray) -> pygame.Surface:
+    """
+    :param array_: uint8 array (h, w, 4) RGBA
+    :return: Return a 32-bit Surface with per-pixel alpha holding the same pixels
+    """
+    h, w = array_.shape[:2]
+    result = pygame.Surface((w, h), pygame.SRCALPHA, 32)
+    pygame.surfarray.pixels3d(result)[...] = array_[:, :, :3].transpose(1, 0, 2)
+    pygame.surfarray.pixels_alpha(result)[...] = array_[:, :, 3].T
+    return result
+
+
+def difference(array1_: numpy.ndarray, array2_: numpy.ndarray) -> int:
+    return int(numpy.abs(array1_.astype(int) - array2_).max())
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('alpha1, alpha2', [('random', 'random'), ('sparse', 'random'),
+                                            ('sparse', 'opaque'), ('random', 'sparse')])
+def test_alpha_blend(size, alpha1, alpha2):
+    texture1, texture2 = texture(size, 1, alpha1), texture(size, 2, alpha2)
+    expected = reference_alpha_blending(texture1, texture2)
+    assert (alpha_blend(texture1, texture2) == expected).all()
+    assert (alpha_blend(texture1, texture2, kernel_='fused') == expected).all()
+    assert difference(alpha_blend(texture1, texture2, integer_=True), expected) <= 1
+    assert difference(alpha_blend(texture1, texture2, kernel_='lut'), expected) <= 4
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('set_alpha1, set_alpha2, mask', [(0.5, 1.0, False), (1.0, 0.3, True),
+                                                          ('array', 0.7, True), (0.2, 'array', False)])
+def test_blend_add(size, set_alpha1, set_alpha2, mask):
+    w, h = size
+    alpha = numpy.random.default_rng(3).random((h, w, 1))
+    set_alpha1 = alpha if set_alpha1 == 'array' else set_alpha1
+    set_alpha2 = alpha if set_alpha2 == 'array' else set_alpha2
+    texture1, texture2 = texture(size, 1, 'sparse'), texture(size, 2)
+    expected = reference_blend_texture_add(texture1, texture2, set_alpha1, set_alpha2, mask)
+    assert (blend_add(texture1, texture2, set_alpha1, set_alpha2, mask) == expected).all()
+    assert difference(blend_add(texture1, texture2, set_alpha1, set_alpha2, mask, integer_=True), expected) <= 1
+
+
+@pytest.mark.parametrize('integer', [False, True])
+def test_uint8_mask(integer):
+    # 8-bit masks (MaskRegistry.get(..., uint8_=True)) are in range [0 ... 255] on both paths
+    texture1, texture2 = texture((67, 45), 1, 'sparse'), texture((67, 45), 2)
+    mask = numpy.random.default_rng(3).integers(0, 256, (45, 67, 1), dtype=numpy.uint8)
+    expected = blend_add(texture1, texture2, mask / 255, 0.7, True, integer)
+    assert (blend_add(texture1, texture2, mask, 0.7, True, integer) == expected).all()
+
+
+@pytest.mark.parametrize('integer', [False, True])
+@pytest.mark.parametrize('alpha2', ['random', 'opaque'])
+def test_tiled_alpha_blending(integer, alpha2):
+    # Tiled, dirty rect and out of core blends give the serial result
+    texture1, texture2 = texture((200, 129), 1, 'sparse'), texture((200, 129), 2, alpha2)
+    surface1, surface2 = surface(texture1), surface(texture2)
+    expected = alpha_blend(texture1, texture2, integer)
+    if not integer:
+        assert (expected == reference_alpha_blending(texture1, texture2)).all()
+
+    out = numpy.empty_like(expected)
+    with BlendEngine(2, (50, 33)) as engine:
+        assert (engine.alpha_blending(surface1, surface2, integer, out_=out) == expected).all()
+
+    compositor = DirtyRectCompositor(surface1, surface2, integer)
+    assert (compositor.array == expected).all()
+    compositor.update([(0, 0, 200, 129)])
+    assert (compositor.array == expected).all()
+
+    assert (composite_tiles(texture1, texture2, out, integer_=integer, tile_=(50, 33)) == expected).all()
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_composite_stack(size):
+    layers = [texture(size, 1, 'sparse'), texture(size, 2), texture(size, 3, 'opaque')]
+    chained = alpha_blend(layers[0], alpha_blend(layers[1], layers[2]))
+    # Chaining truncates the intermediate image
+    assert difference(composite_stack(layers, out_=numpy.empty_like(chained)), chained) <= len(layers) - 1